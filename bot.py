@@ -1,4 +1,4 @@
-"""Точка входа: инициализация логирования, создание бота/DP и запуск polling."""
+"""Точка входа: инициализация логирования, создание бота/DP и запуск polling (или регистрация webhook)."""
 
 from __future__ import annotations
 
@@ -7,47 +7,100 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties
 from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN
+from config import BOT_MODE, BOT_TOKEN, DOMAIN, WEBHOOK_MAX_CONCURRENCY, WEBHOOK_PATH, WEBHOOK_SECRET
+from db.base import get_pool_stats
 from handlers import register_handlers
+from utils.activity import activity_buffer
+from utils.broadcast import broadcast_runner
+from utils.expiry import expiry_scheduler
+from utils.fsm_storage import create_fsm_storage
+from utils.outbox import outbox_worker
 from utils.logger import setup_logger
+from utils.payment import close_payment_client
 
 logger = logging.getLogger(__name__)
 
 
-def _create_bot() -> Bot:
+def create_bot() -> Bot:
     """Создаёт экземпляр бота с HTML parse_mode."""
     if not BOT_TOKEN:
         raise RuntimeError("BOT_TOKEN не задан")
     return Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 
 
-def _create_dispatcher() -> Dispatcher:
-    """Создаёт диспетчер с in-memory хранилищем FSM."""
-    return Dispatcher(storage=MemoryStorage())
+def create_dispatcher() -> Dispatcher:
+    """Создаёт диспетчер с хранилищем FSM из конфигурации (по умолчанию — Postgres)."""
+    return Dispatcher(storage=create_fsm_storage())
+
+
+def check_webhook_config() -> None:
+    """Проверяет настройки webhook-режима (без секрета апдейты мог бы прислать кто угодно)."""
+    if BOT_MODE not in {"polling", "webhook"}:
+        raise RuntimeError("BOT_MODE must be 'polling' or 'webhook'")
+    if BOT_MODE == "webhook" and not (WEBHOOK_SECRET and DOMAIN):
+        raise RuntimeError("BOT_MODE=webhook требует WEBHOOK_SECRET и DOMAIN")
+
+
+async def _set_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Регистрирует webhook в Telegram: апдейты принимает server.py."""
+    url = f"{DOMAIN.rstrip('/')}{WEBHOOK_PATH}"
+    await bot.set_webhook(
+        url=url,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONCURRENCY,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info("✅ [WEBHOOK] Webhook установлен: %s", url)
 
 
 async def main() -> None:
-    """Настраивает логирование, регистрирует хендлеры и запускает polling."""
-    bot = _create_bot()
-    dp = _create_dispatcher()
+    """Настраивает логирование, регистрирует хендлеры и запускает polling.
+
+    В режиме webhook процесс только регистрирует webhook и остаётся владельцем
+    фоновых задач (выполнение рассылок, outbox уведомлений, напоминания об
+    окончании подписки), а апдейты обрабатывают реплики server.py.
+    """
+    check_webhook_config()
+    bot = create_bot()
+    dp = create_dispatcher()
 
     setup_logger(bot)
+    me = await bot.me()  # кэш в Bot: платежи и реф. ссылки больше не ходят за get_me
+    logger.info("Бот: @%s (id=%s)", me.username, me.id)
+    logger.info("DB pool: %s", get_pool_stats())
     logger.info("Регистрация обработчиков...")
     register_handlers(dp)
 
-    logger.info("Удаление старых апдейтов и запуск polling...")
-    await bot.delete_webhook(drop_pending_updates=True)
+    if BOT_MODE == "webhook":
+        await _set_webhook(bot, dp)
+    else:
+        logger.info("Удаление старых апдейтов и запуск polling...")
+        await bot.delete_webhook(drop_pending_updates=True)
+        activity_buffer.start()
+
+    outbox_worker.start(bot)
+    expiry_scheduler.start()
+    broadcast_runner.start(bot)
 
     try:
-        logger.info("Bot started (polling mode).")
-        await dp.start_polling(bot)
+        if BOT_MODE == "webhook":
+            logger.info("Bot started (webhook mode, updates -> server.py%s).", WEBHOOK_PATH)
+            await asyncio.Event().wait()
+        else:
+            logger.info("Bot started (polling mode).")
+            await dp.start_polling(bot)
     except asyncio.CancelledError:  # нормальное завершение
         logger.info("Polling cancelled.")
         raise
     finally:
+        await activity_buffer.stop()
+        await broadcast_runner.stop()
+        await expiry_scheduler.stop()
+        await outbox_worker.stop()
+        await close_payment_client()
         await bot.session.close()
+        logger.info("DB pool at shutdown: %s", get_pool_stats())
         logger.info("Bot session closed.")
 
 
@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Ключ HMAC приветственных промокодов (по умолчанию — токен бота; смена ключа аннулирует выданные коды)
+WELCOME_PROMO_SECRET = os.getenv("WELCOME_PROMO_SECRET") or BOT_TOKEN or ""
 
 ADMINS = list(map(int, os.getenv("ADMINS", "").split(",")))
 
@@ -22,4 +24,21 @@ SUBSCRIPTION_YEARS_FOR_LIFETIME = 100
 SUBSCRIPTION_LIFETIME_DAYS = SUBSCRIPTION_YEARS_FOR_LIFETIME * 365
 
 BROADCAST_PROGRESS_UPDATE_INTERVAL = 7
-BROADCAST_PER_MESSAGE_DELAY = 0.2
\ No newline at end of file
+BROADCAST_RATE_LIMIT = 28  # сообщений/сек (глобальный лимит Telegram ~30)
+BROADCAST_MAX_CONCURRENCY = 16
+BROADCAST_MAX_RETRIES = 3
+BROADCAST_CHECKPOINT_BATCH = 200  # как часто сохранять прогресс рассылки в БД
+BROADCAST_JOB_POLL_INTERVAL = 5  # секунд: как быстро bot.py подхватывает новые задания рассылки
+BROADCAST_JOB_LEASE = 60  # секунд: задание упавшего исполнителя освобождается после аренды
+
+# Хранилище FSM: sql (Postgres, по умолчанию) | redis | memory
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sql").lower()
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", "redis://localhost:6379/0")
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "30"))  # сек, 0 — без in-process кэша
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+
+# Приём апдейтов: polling (bot.py) | webhook (POST на server.py, можно несколько реплик)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "40"))  # апдейтов одновременно на процесс
@@ -2,5 +2,11 @@ from .users import User, UserActivity
 from .subscribers import Subscriber
 from .support import SupportTicket
 from .tariff import Tariff
-from .promocodes import Promocode
-from .channels import Channel, FeatureFlag 
\ No newline at end of file
+from .promocodes import Promocode, PromocodeRedemption
+from .channels import Channel, FeatureFlag
+from .broadcasts import BroadcastJob
+from .metrics import DailyMetric
+from .fsm import FSMState
+from .versions import CacheVersion
+from .outbox import OutboxMessage
+from .subscription_notices import SchedulerCursor, SubscriptionNotice
@@ -16,12 +16,42 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set in environment variables")
 
-SQL_ECHO = os.getenv("SQL_ECHO", "0").lower() in {"1", "true", "yes", "on"}
+_TRUTHY = {"1", "true", "yes", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+SQL_ECHO = os.getenv("SQL_ECHO", "0").lower() in _TRUTHY
+
+# --- Пул соединений (каждый процесс — бот и server.py — настраивается своим окружением) ---
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5)
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30)  # сек ожидания свободного соединения
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 1800)  # сек жизни соединения, -1 — без ограничения
+# Проверка живости соединения: pre_ping — SELECT 1 на каждый checkout,
+# recycle — только пересоздание по DB_POOL_RECYCLE (без лишнего round trip).
+DB_POOL_LIVENESS = os.getenv("DB_POOL_LIVENESS", "pre_ping").lower()
+if DB_POOL_LIVENESS not in {"pre_ping", "recycle"}:
+    raise RuntimeError("DB_POOL_LIVENESS must be 'pre_ping' or 'recycle'")
+# Кэш prepared statements asyncpg на соединение (0 — выключить, например за pgbouncer)
+DB_STATEMENT_CACHE_SIZE = _env_int("DB_STATEMENT_CACHE_SIZE", 100)
+
+_connect_args = {}
+if "asyncpg" in DATABASE_URL:
+    _connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
 
 engine = create_async_engine(
     DATABASE_URL,
     echo=SQL_ECHO,
-    pool_pre_ping=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_LIVENESS == "pre_ping",
+    connect_args=_connect_args,
 )
 async_session = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
@@ -35,4 +65,18 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
             ...
     """
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def get_pool_stats() -> dict[str, int | str]:
+    """Текущее состояние пула соединений (для health-эндпоинта и логов)."""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "timeout": DB_POOL_TIMEOUT,
+        "liveness": DB_POOL_LIVENESS,
+    }
@@ -0,0 +1,164 @@
+import datetime
+
+from sqlalchemy import JSON, BigInteger, Column, DateTime, Integer, String, and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
+
+from db.base import Base
+
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"  # остановлено ошибкой, автоматически не возобновляется
+
+
+class BroadcastJob(Base):
+    """
+    Задание рассылки с чекпоинтом (переживает рестарт бота).
+    id: ID задания
+    admin_id: кто запустил (получает прогресс и отчёт)
+    audience: аудитория (db.users.AUDIENCE_*)
+    payload: содержимое сообщения (текст, кнопка, медиа)
+    status: running / done / failed
+    last_user_id: все user_id <= этого значения уже обработаны
+    total: размер аудитории на момент запуска
+    sent / failed: счётчики
+    progress_message_id: сообщение с прогресс-баром у админа
+    owner / lease_until: исполнитель задания и срок его аренды (задание без живой аренды может забрать другой)
+    """
+    __tablename__ = 'broadcast_jobs'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    admin_id = Column(BigInteger, nullable=False)
+    audience = Column(String(32), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(16), nullable=False, server_default=JOB_STATUS_RUNNING, index=True)
+    last_user_id = Column(BigInteger, nullable=True)
+    total = Column(Integer, nullable=False, server_default="0")
+    sent = Column(Integer, nullable=False, server_default="0")
+    failed = Column(Integer, nullable=False, server_default="0")
+    progress_message_id = Column(BigInteger, nullable=True)
+    owner = Column(String(64), nullable=True)
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"<BroadcastJob id={self.id} audience={self.audience} status={self.status} "
+            f"last_user_id={self.last_user_id} sent={self.sent} failed={self.failed}>"
+        )
+
+
+async def create_broadcast_job(
+    session: AsyncSession, admin_id: int, audience: str, payload: dict, total: int
+) -> BroadcastJob:
+    """Создаёт задание рассылки в статусе running."""
+    job = BroadcastJob(admin_id=admin_id, audience=audience, payload=payload, total=total)
+    session.add(job)
+    try:
+        await session.commit()
+        await session.refresh(job)
+    except SQLAlchemyError:
+        await session.rollback()
+        raise
+    return job
+
+
+async def set_broadcast_progress_message(
+    session: AsyncSession, job_id: int, owner: str, message_id: int
+) -> None:
+    """Запоминает сообщение с прогресс-баром, чтобы после рестарта продолжить его обновлять."""
+    await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.id == job_id, BroadcastJob.owner == owner)
+        .values(progress_message_id=message_id)
+    )
+    await session.commit()
+
+
+async def save_broadcast_checkpoint(
+    session: AsyncSession,
+    job_id: int,
+    owner: str,
+    last_user_id: int | None,
+    sent: int,
+    failed: int,
+    *,
+    release: bool = False,
+) -> bool:
+    """
+    Сохраняет чекпоинт рассылки одним UPDATE, если задание всё ещё за owner.
+    release=True снимает аренду (остановка процесса): задание сразу сможет забрать следующий запуск.
+    Возвращает False, если задание уже перешло к другому исполнителю (чекпоинт не записан).
+    """
+    values = {"last_user_id": last_user_id, "sent": sent, "failed": failed}
+    if release:
+        values.update(owner=None, lease_until=None)
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.id == job_id, BroadcastJob.owner == owner)
+        .values(**values)
+    )
+    await session.commit()
+    return result.rowcount > 0
+
+
+async def finish_broadcast_job(
+    session: AsyncSession,
+    job_id: int,
+    owner: str,
+    last_user_id: int | None,
+    sent: int,
+    failed: int,
+    *,
+    status: str = JOB_STATUS_DONE,
+) -> None:
+    """Фиксирует итоговые счётчики и помечает задание завершённым (или failed при ошибке), если оно за owner."""
+    await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.id == job_id, BroadcastJob.owner == owner)
+        .values(
+            status=status,
+            last_user_id=last_user_id,
+            sent=sent,
+            failed=failed,
+            finished_at=datetime.datetime.now(datetime.timezone.utc),
+        )
+    )
+    await session.commit()
+
+
+async def claim_broadcast_jobs(session: AsyncSession, owner: str, lease_seconds: float) -> list[BroadcastJob]:
+    """
+    Забирает незавершённые задания без живого исполнителя (owner пуст или аренда
+    истекла) за owner на `lease_seconds` и коммитит. Условие проверяется в том же
+    UPDATE под FOR UPDATE SKIP LOCKED, поэтому у задания не бывает двух исполнителей.
+    """
+    claimable = and_(
+        BroadcastJob.status == JOB_STATUS_RUNNING,
+        or_(BroadcastJob.owner.is_(None), BroadcastJob.lease_until < func.now()),
+    )
+    free = select(BroadcastJob.id).where(claimable).with_for_update(skip_locked=True)
+    result = await session.scalars(
+        update(BroadcastJob)
+        .where(BroadcastJob.id.in_(free), claimable)
+        .values(owner=owner, lease_until=func.now() + datetime.timedelta(seconds=lease_seconds))
+        .returning(BroadcastJob)
+        .execution_options(synchronize_session=False)
+    )
+    jobs = sorted(result.all(), key=lambda job: job.id)
+    await session.commit()
+    return jobs
+
+
+async def renew_broadcast_leases(session: AsyncSession, owner: str, lease_seconds: float) -> set[int]:
+    """Продлевает аренду незавершённых заданий owner и возвращает их id (остальные он потерял)."""
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.owner == owner, BroadcastJob.status == JOB_STATUS_RUNNING)
+        .values(lease_until=func.now() + datetime.timedelta(seconds=lease_seconds))
+        .returning(BroadcastJob.id)
+    )
+    job_ids = set(result.scalars().all())
+    await session.commit()
+    return job_ids
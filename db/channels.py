@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import asyncio
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Sequence
 
@@ -16,8 +19,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import func
 
 from db.base import Base
+from db.versions import VersionedSnapshot, bump_cache_version
 
 CHANNEL_GUARD_FLAG = "channel_guard"
+CHANNELS_CACHE = "channels"
+
+MEMBERSHIP_CHECK_CONCURRENCY = 5  # одновременных get_chat_member на одну проверку
+MEMBERSHIP_CACHE_TTL = 3600  # сек, подтверждённая подписка
+MEMBERSHIP_NEGATIVE_TTL = 30  # сек, отсутствие подписки / ошибка проверки
+MEMBERSHIP_CACHE_SIZE = 100_000
+MEMBER_STATUSES = {"member", "administrator", "creator", "restricted"}
 
 
 class Channel(Base):
@@ -60,7 +71,7 @@ async def add_channel(session: AsyncSession, username: str) -> Channel:
     username = username.lstrip('@').lower().strip()
     channel = Channel(username=username)
     session.add(channel)
-    await session.commit()
+    await _commit_channels_change(session)
     await session.refresh(channel)
     return channel
 
@@ -82,7 +93,7 @@ async def delete_channel(session: AsyncSession, channel_id: int) -> bool:
     if not channel:
         return False
     await session.delete(channel)
-    await session.commit()
+    await _commit_channels_change(session)
     return True
 
 
@@ -93,7 +104,7 @@ async def toggle_channel_required(session: AsyncSession, channel_id: int) -> boo
     if not channel:
         return False
     channel.is_required = not channel.is_required
-    await session.commit()
+    await _commit_channels_change(session)
     return True
 
 
@@ -104,7 +115,7 @@ async def toggle_channel_active(session: AsyncSession, channel_id: int) -> bool:
     if not channel:
         return False
     channel.active = not channel.active
-    await session.commit()
+    await _commit_channels_change(session)
     return True
 
 
@@ -134,10 +145,47 @@ async def toggle_channel_guard(session: AsyncSession) -> bool:
         session.add(ff)
     else:
         ff.enabled = not ff.enabled
-    await session.commit()
+    await _commit_channels_change(session)
     return ff.enabled
 
 
+# -------- Снимок для channel guard ---------
+
+@dataclass(frozen=True, slots=True)
+class ChannelGuardSnapshot:
+    """Состояние ограничения: включено ли и какие каналы обязательны."""
+    enabled: bool
+    channels: tuple[Channel, ...]
+
+
+async def _load_guard_snapshot(session: AsyncSession) -> ChannelGuardSnapshot:
+    enabled = await is_channel_guard_enabled(session)
+    channels = tuple(await get_required_active_channels(session))
+    for ch in channels:  # снимок разделяется между апдейтами — отвязываем от сессии
+        session.expunge(ch)
+    return ChannelGuardSnapshot(enabled=enabled, channels=channels)
+
+
+_guard_snapshot: VersionedSnapshot[ChannelGuardSnapshot] = VersionedSnapshot(CHANNELS_CACHE, _load_guard_snapshot)
+
+
+async def get_channel_guard_snapshot(session: AsyncSession) -> ChannelGuardSnapshot:
+    """
+    Флаг и обязательные каналы из кэша процесса (без запроса к БД, пока версия
+    справочника не изменилась — см. db.versions).
+    """
+    return await _guard_snapshot.get(session)
+
+
+async def _commit_channels_change(session: AsyncSession) -> None:
+    """Коммитит изменение каналов/флага вместе с новой версией справочника и сбрасывает снимок."""
+    try:
+        await bump_cache_version(session, CHANNELS_CACHE)
+        await session.commit()
+    finally:
+        _guard_snapshot.invalidate()
+
+
 # -------- Проверка подписки пользователя ---------
 
 @dataclass(slots=True)
@@ -147,24 +195,50 @@ class ChannelCheckResult:
 
 
 
+# (user_id, канал) -> (истекает в, is_member); порядок вставки — для вытеснения старых записей
+_membership_cache: OrderedDict[tuple[int, int | str], tuple[float, bool]] = OrderedDict()
+
+
+def _remember_membership(key: tuple[int, int | str], is_member: bool) -> None:
+    ttl = MEMBERSHIP_CACHE_TTL if is_member else MEMBERSHIP_NEGATIVE_TTL
+    _membership_cache[key] = (time.monotonic() + ttl, is_member)
+    _membership_cache.move_to_end(key)
+    while len(_membership_cache) > MEMBERSHIP_CACHE_SIZE:
+        _membership_cache.popitem(last=False)
+
+
 async def check_user_memberships(
     bot,
     user_id: int,
     channels: Sequence[Channel],
+    *,
+    refresh: bool = False,
 ) -> list[ChannelCheckResult]:
     """
     Проверяет подписку пользователя на список каналов.
-    Возвращает список ChannelCheckResult (channel, is_member).
+    Возвращает список ChannelCheckResult (channel, is_member) в порядке `channels`.
+
+    Запросы к Telegram идут параллельно (не больше MEMBERSHIP_CHECK_CONCURRENCY),
+    результаты кэшируются на (user, канал): подписка — на MEMBERSHIP_CACHE_TTL,
+    её отсутствие — на MEMBERSHIP_NEGATIVE_TTL. refresh=True перепроверяет
+    отрицательные результаты (кнопка «Я подписался»).
     """
-    results: list[ChannelCheckResult] = []
-    for ch in channels:
-        ok = False
-        try:
-            target = ch.chat_id if ch.chat_id else f"@{ch.username}"
-            member = await bot.get_chat_member(target, user_id)
-            status = getattr(member, 'status', '')
-            ok = status in {"member", "administrator", "creator", "restricted"}
-        except Exception:  # noqa: BLE001
-            ok = False
-        results.append(ChannelCheckResult(channel=ch, is_member=ok))
-    return results
+    semaphore = asyncio.Semaphore(MEMBERSHIP_CHECK_CONCURRENCY)
+    now = time.monotonic()
+
+    async def _check(ch: Channel) -> ChannelCheckResult:
+        target = ch.chat_id if ch.chat_id else f"@{ch.username}"
+        key = (user_id, target)
+        cached = _membership_cache.get(key)
+        if cached and cached[0] > now and (cached[1] or not refresh):
+            return ChannelCheckResult(channel=ch, is_member=cached[1])
+        async with semaphore:
+            try:
+                member = await bot.get_chat_member(target, user_id)
+                ok = getattr(member, 'status', '') in MEMBER_STATUSES
+            except Exception:  # noqa: BLE001
+                ok = False
+        _remember_membership(key, ok)
+        return ChannelCheckResult(channel=ch, is_member=ok)
+
+    return list(await asyncio.gather(*(_check(ch) for ch in channels)))
@@ -0,0 +1,77 @@
+"""
+Хранилище состояний FSM в Postgres: одна компактная строка на ключ (чат + пользователь).
+Пустые записи (нет состояния и данных) удаляются, таблица не разрастается.
+"""
+
+from typing import Any, Optional
+
+from sqlalchemy import Column, DateTime, String, delete, func, select, update
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.base import Base
+
+
+class FSMState(Base):
+    """
+    Состояние FSM.
+    key: ключ хранилища aiogram (fsm:<chat_id>:<user_id>)
+    state: текущее состояние или NULL
+    data: данные сценария (JSON)
+    """
+    __tablename__ = 'fsm_state'
+    key = Column(String(255), primary_key=True)
+    state = Column(String(255), nullable=True)
+    data = Column(JSONB, nullable=False, server_default="{}")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self) -> str:
+        return f"<FSMState key={self.key} state={self.state}>"
+
+
+async def get_fsm_record(session: AsyncSession, key: str) -> tuple[Optional[str], dict[str, Any]]:
+    """Возвращает (state, data) по ключу; для отсутствующей записи — (None, {})."""
+    row = (await session.execute(select(FSMState.state, FSMState.data).where(FSMState.key == key))).first()
+    if row is None:
+        return None, {}
+    return row.state, dict(row.data or {})
+
+
+async def save_fsm_state(session: AsyncSession, key: str, state: Optional[str]) -> None:
+    """Записывает состояние (upsert), данные не трогает."""
+    if state is None:
+        await _reset_field(session, key, state=None)
+    else:
+        stmt = insert(FSMState).values(key=key, state=state)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FSMState.key],
+            set_={"state": stmt.excluded.state, "updated_at": func.now()},
+        )
+        await session.execute(stmt)
+    await session.commit()
+
+
+async def save_fsm_data(session: AsyncSession, key: str, data: dict[str, Any]) -> None:
+    """Заменяет данные (upsert), состояние не трогает."""
+    if not data:
+        await _reset_field(session, key, data={})
+    else:
+        stmt = insert(FSMState).values(key=key, data=data)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FSMState.key],
+            set_={"data": stmt.excluded.data, "updated_at": func.now()},
+        )
+        await session.execute(stmt)
+    await session.commit()
+
+
+async def _reset_field(session: AsyncSession, key: str, **values: Any) -> None:
+    """Очищает поле существующей записи (новую не создаёт) и удаляет запись, если она опустела."""
+    await session.execute(update(FSMState).where(FSMState.key == key).values(**values))
+    await session.execute(
+        delete(FSMState).where(
+            FSMState.key == key,
+            FSMState.state.is_(None),
+            FSMState.data == {},
+        )
+    )
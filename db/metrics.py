@@ -0,0 +1,84 @@
+"""
+Дневные метрики (rollup): DAU, новые пользователи, подписки и оплаты по дням.
+Счётчики увеличиваются инкрементально в момент события, поэтому статистика
+читает O(дней) строк вместо сканирования событийных таблиц.
+"""
+
+import datetime
+
+from sqlalchemy import Column, Date, DateTime, Integer, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.base import Base
+
+
+class DailyMetric(Base):
+    """
+    Агрегаты за один день (UTC).
+    day: дата
+    dau: уникальные активные пользователи
+    new_users: регистрации
+    new_subscriptions: оформления/продления подписок
+    payments: успешные оплаты
+    """
+    __tablename__ = 'daily_metrics'
+    day = Column(Date, primary_key=True)
+    dau = Column(Integer, nullable=False, server_default="0")
+    new_users = Column(Integer, nullable=False, server_default="0")
+    new_subscriptions = Column(Integer, nullable=False, server_default="0")
+    payments = Column(Integer, nullable=False, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self) -> str:
+        return (
+            f"<DailyMetric day={self.day} dau={self.dau} new_users={self.new_users} "
+            f"new_subscriptions={self.new_subscriptions} payments={self.payments}>"
+        )
+
+
+def utc_today() -> datetime.date:
+    """Текущая дата в UTC (граница суток для всех метрик)."""
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+async def bump_daily_metrics(
+    session: AsyncSession,
+    *,
+    day: datetime.date | None = None,
+    dau: int = 0,
+    new_users: int = 0,
+    new_subscriptions: int = 0,
+    payments: int = 0,
+) -> None:
+    """
+    Увеличивает счётчики дня одним INSERT ... ON CONFLICT (day) DO UPDATE.
+    Не коммитит: выполняется в транзакции вызывающего вместе с самим событием.
+    """
+    stmt = insert(DailyMetric).values(
+        day=day or utc_today(),
+        dau=dau,
+        new_users=new_users,
+        new_subscriptions=new_subscriptions,
+        payments=payments,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyMetric.day],
+        set_={
+            "dau": DailyMetric.dau + stmt.excluded.dau,
+            "new_users": DailyMetric.new_users + stmt.excluded.new_users,
+            "new_subscriptions": DailyMetric.new_subscriptions + stmt.excluded.new_subscriptions,
+            "payments": DailyMetric.payments + stmt.excluded.payments,
+            "updated_at": func.now(),
+        },
+    )
+    await session.execute(stmt)
+
+
+async def get_daily_metrics(session: AsyncSession, days: int) -> list[DailyMetric]:
+    """Возвращает метрики за последние `days` дней (включая сегодня), по возрастанию даты."""
+    since = utc_today() - datetime.timedelta(days=days - 1)
+    result = await session.execute(
+        select(DailyMetric).where(DailyMetric.day >= since).order_by(DailyMetric.day)
+    )
+    return list(result.scalars().all())
@@ -0,0 +1,100 @@
+"""
+Outbox уведомлений: событие (оплата и т.п.) записывает уведомление в той же
+транзакции, а фоновый воркер (utils/outbox.py) доставляет его в Telegram
+с повторами. Доставленные записи удаляются, недоставленные навсегда
+остаются с next_attempt_at = NULL для разбора.
+"""
+
+from datetime import timedelta
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, Text, delete, func, select, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.base import Base
+
+# Виды уведомлений (текст собирает воркер по kind + payload)
+OUTBOX_PAYMENT_USER = "payment_user"     # пользователю: подписка продлена
+OUTBOX_PAYMENT_ADMIN = "payment_admin"   # в группу поддержки: новая оплата
+OUTBOX_SUBSCRIPTION_EXPIRING = "subscription_expiring"  # пользователю: подписка скоро закончится
+OUTBOX_SUBSCRIPTION_EXPIRED = "subscription_expired"    # пользователю: подписка закончилась
+
+
+class OutboxMessage(Base):
+    """
+    Уведомление, ожидающее доставки.
+    id: ID записи
+    kind: вид уведомления (OUTBOX_*)
+    payload: данные для текста (JSON)
+    attempts: сколько раз воркер брал запись в работу
+    next_attempt_at: когда пробовать снова; NULL — доставка прекращена
+    last_error: последняя ошибка доставки
+    """
+    __tablename__ = 'notification_outbox'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    kind = Column(String(32), nullable=False)
+    payload = Column(JSONB, nullable=False, server_default="{}")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True, server_default=func.now(), index=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<OutboxMessage id={self.id} kind={self.kind} attempts={self.attempts}>"
+
+
+def enqueue_notification(session: AsyncSession, kind: str, payload: dict[str, Any]) -> None:
+    """Добавляет уведомление в outbox. Не коммитит: пишется в транзакции события."""
+    session.add(OutboxMessage(kind=kind, payload=payload))
+
+
+async def claim_outbox_batch(session: AsyncSession, limit: int, lease_seconds: float) -> Sequence[Row]:
+    """
+    Забирает до `limit` готовых к отправке уведомлений и коммитит.
+    Захваченные записи откладываются на `lease_seconds` (аренда): если воркер
+    упадёт, не подтвердив доставку, запись вернётся в очередь после аренды.
+    FOR UPDATE SKIP LOCKED позволяет нескольким воркерам не мешать друг другу.
+    """
+    due = (
+        select(OutboxMessage.id)
+        .where(OutboxMessage.next_attempt_at <= func.now())
+        .order_by(OutboxMessage.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id.in_(due))
+        .values(
+            attempts=OutboxMessage.attempts + 1,
+            next_attempt_at=func.now() + timedelta(seconds=lease_seconds),
+        )
+        .returning(OutboxMessage.id, OutboxMessage.kind, OutboxMessage.payload, OutboxMessage.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await session.commit()
+    return rows
+
+
+async def delete_outbox_messages(session: AsyncSession, ids: Sequence[int]) -> None:
+    """Удаляет доставленные уведомления."""
+    if not ids:
+        return
+    await session.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(ids)))
+    await session.commit()
+
+
+async def reschedule_outbox_message(
+    session: AsyncSession, message_id: int, delay: Optional[float], error: str
+) -> None:
+    """Откладывает повтор на `delay` секунд; delay=None — прекращает доставку."""
+    next_attempt_at = func.now() + timedelta(seconds=delay) if delay is not None else None
+    await session.execute(
+        update(OutboxMessage)
+        .where(OutboxMessage.id == message_id)
+        .values(next_attempt_at=next_attempt_at, last_error=error[:1000])
+    )
+    await session.commit()
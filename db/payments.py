@@ -0,0 +1,58 @@
+"""
+Исполнение оплаченного заказа: захват payment_id, продление подписки, флаг оплаты
+и уведомления (outbox) в одной транзакции (один commit), без окна для двойного
+исполнения между процессами.
+"""
+
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.metrics import bump_daily_metrics
+from db.outbox import OUTBOX_PAYMENT_ADMIN, OUTBOX_PAYMENT_USER, enqueue_notification
+from db.subscribers import ProcessedPayment, extend_subscription
+from db.users import set_user_paid
+
+
+async def fulfill_payment(
+    session: AsyncSession, payment_id: str, user_id: int, days: int, *, tariff_name: str
+) -> datetime | None:
+    """
+    Исполняет платёж и возвращает новую дату окончания подписки (UTC).
+    Возвращает None, если payment_id уже был обработан (повторный webhook).
+
+    Порядок: INSERT processed_payments ... ON CONFLICT DO NOTHING RETURNING
+    (захват), продление подписки, метрики, флаг оплаты, уведомления в outbox,
+    commit. Конкурентный дубликат ждёт на уникальном индексе и после commit
+    первого получает None.
+    """
+    if not payment_id:
+        raise ValueError("payment_id обязателен")
+    try:
+        claimed = await session.scalar(
+            insert(ProcessedPayment)
+            .values(payment_id=payment_id, user_id=user_id)
+            .on_conflict_do_nothing(index_elements=[ProcessedPayment.payment_id])
+            .returning(ProcessedPayment.id)
+        )
+        if claimed is None:
+            await session.rollback()
+            return None
+        expire_at = await extend_subscription(session, user_id, days, bump_metrics=False)
+        await bump_daily_metrics(session, new_subscriptions=1, payments=1)
+        await set_user_paid(session, user_id)
+        payload = {
+            "user_id": user_id,
+            "days": days,
+            "tariff_name": tariff_name,
+            "expire_at": expire_at.isoformat(),
+        }
+        enqueue_notification(session, OUTBOX_PAYMENT_USER, payload)
+        enqueue_notification(session, OUTBOX_PAYMENT_ADMIN, payload)
+        await session.commit()
+    except SQLAlchemyError:
+        await session.rollback()
+        raise
+    return expire_at
@@ -1,10 +1,28 @@
-from sqlalchemy import Column, Integer, String, delete, select, func
+import base64
+import datetime
+import hashlib
+import hmac
+import secrets
+
+from sqlalchemy import BigInteger, Column, DateTime, Integer, String, delete, select, func, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
 
+from config import WELCOME_PROMO_SECRET
 from db.base import Base
 
 
 
+WELCOME_PROMO_PREFIX = "WELCOME"
+WELCOME_PROMO_DAYS = 7
+WELCOME_PROMO_LENGTH = 10  # символов base32 после префикса (50 бит подписи)
+
+PROMO_CODE_CHARSET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # без похожих символов (0/O, 1/I)
+PROMO_BULK_BATCH = 5000  # строк на один executemany
+PROMO_BULK_MAX_ROUNDS = 10  # повторов генерации для коллизий
+
+
 class Promocode(Base):
     """Модель промокода."""
     __tablename__ = 'promocodes'
@@ -16,6 +34,36 @@ class Promocode(Base):
         return f"<Promocode code={self.code} days={self.duration_days} uses_left={self.uses_left}>"
 
 
+class PromocodeRedemption(Base):
+    """
+    Журнал активаций промокодов (код может быть уже удалён — без внешнего ключа).
+    code: промокод
+    user_id: кто активировал
+    redeemed_at: когда
+    """
+    __tablename__ = 'promocode_redemptions'
+    code = Column(String, primary_key=True)  # PK (code, user_id) — уникальность активации
+    user_id = Column(BigInteger, primary_key=True)
+    redeemed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
+
+    def __repr__(self) -> str:
+        return f"<PromocodeRedemption code={self.code} user_id={self.user_id} redeemed_at={self.redeemed_at}>"
+
+
+
+def welcome_promocode(user_id: int) -> str:
+    """
+    Приветственный промокод пользователя: HMAC от user_id, в БД не хранится.
+    Активировать его может только сам пользователь и только один раз (журнал активаций).
+    """
+    digest = hmac.new(WELCOME_PROMO_SECRET.encode(), f"welcome:{user_id}".encode(), hashlib.sha256).digest()
+    return f"{WELCOME_PROMO_PREFIX}-{base64.b32encode(digest).decode()[:WELCOME_PROMO_LENGTH]}"
+
+
+def is_welcome_promocode(code: str, user_id: int) -> bool:
+    """Проверяет, что код — приветственный промокод именно этого пользователя."""
+    return bool(WELCOME_PROMO_SECRET) and hmac.compare_digest(code.upper(), welcome_promocode(user_id))
+
 
 async def add_promocode(
     session: AsyncSession, code: str, duration_days: int, uses_left: int = 1
@@ -31,6 +79,75 @@ async def add_promocode(
     return promocode
 
 
+def _random_code(length: int, charset: str) -> str:
+    """Криптостойкий код: один вызов urandom, байты вне кратного len(charset) отбрасываются (без смещения)."""
+    n = len(charset)
+    limit = 256 - 256 % n
+    chars: list[str] = []
+    while len(chars) < length:
+        chars.extend(charset[b % n] for b in secrets.token_bytes(length) if b < limit)
+    return "".join(chars[:length])
+
+
+def _random_codes(count: int, length: int, charset: str, prefix: str) -> set[str]:
+    head = f"{prefix.upper()}-" if prefix else ""
+    codes: set[str] = set()
+    while len(codes) < count:
+        codes.add(head + _random_code(length, charset))
+    return codes
+
+
+async def create_promocodes_bulk(
+    session: AsyncSession,
+    count: int,
+    duration_days: int,
+    *,
+    uses_left: int = 1,
+    length: int = 8,
+    charset: str = PROMO_CODE_CHARSET,
+    prefix: str = "",
+) -> list[str]:
+    """
+    Создаёт `count` уникальных промокодов вида [PREFIX-]XXXXXXXX и возвращает их.
+    Коды вставляются пачками INSERT ... ON CONFLICT DO NOTHING RETURNING code;
+    заново генерируются только коллизии. Всё — в одной транзакции.
+    """
+    if count <= 0 or length <= 0 or not charset:
+        raise ValueError("count, length и charset должны быть непустыми")
+    charset = "".join(dict.fromkeys(charset))  # без повторов символов
+    if len(charset) ** length < count:
+        raise ValueError(f"Длины {length} не хватает на {count} уникальных кодов")
+    # executemany с RETURNING: SQLAlchemy сам собирает многострочные VALUES (insertmanyvalues)
+    stmt = (
+        insert(Promocode)
+        .on_conflict_do_nothing(index_elements=[Promocode.code])
+        .returning(Promocode.code)
+    )
+    created: list[str] = []
+    try:
+        for _ in range(PROMO_BULK_MAX_ROUNDS):
+            missing = count - len(created)
+            if not missing:
+                break
+            candidates = list(_random_codes(missing, length, charset, prefix))
+            for start in range(0, len(candidates), PROMO_BULK_BATCH):
+                batch = candidates[start:start + PROMO_BULK_BATCH]
+                result = await session.scalars(
+                    stmt,
+                    [{"code": c, "duration_days": duration_days, "uses_left": uses_left} for c in batch],
+                )
+                created.extend(result.all())
+        if len(created) < count:
+            raise RuntimeError(
+                f"Создано {len(created)} из {count} промокодов: мало комбинаций для длины {length}"
+            )
+        await session.commit()
+    except (SQLAlchemyError, RuntimeError):
+        await session.rollback()
+        raise
+    return created
+
+
 async def get_or_create_promocode(
     session: AsyncSession, code: str, duration_days: int, uses_left: int = 1
 ) -> Promocode:
@@ -47,25 +164,87 @@ async def activate_promocode(
 ) -> int | None:
     """
     Активирует промокод для пользователя.
-    Уменьшает количество использований и удаляет, если они закончились.
-    Возвращает длительность подписки в днях или None, если код недействителен.
+    Запись в журнал (уникальна по коду и пользователю) и списание использования —
+    UPDATE ... WHERE uses_left > 0 RETURNING, поэтому одновременные активации
+    не превысят лимит; продление подписки коммитится в той же транзакции.
+    Исчерпанный код удаляется.
+    Возвращает длительность подписки в днях или None, если код недействителен
+    или уже активирован этим пользователем.
     """
     # Локальный импорт для избежания циклических зависимостей
-    from db.subscribers import add_subscriber_with_duration
+    from db.subscribers import extend_subscription
+
+    code = code.upper()
+    if is_welcome_promocode(code, user_id):
+        return await _activate_welcome_promocode(session, user_id, code)
+    try:
+        if not await _record_redemption(session, code, user_id):
+            await session.rollback()
+            return None
+        row = (await session.execute(
+            update(Promocode)
+            .where(Promocode.code == code, Promocode.uses_left > 0)
+            .values(uses_left=Promocode.uses_left - 1)
+            .returning(Promocode.duration_days, Promocode.uses_left)
+        )).first()
+        if row is None:
+            await session.rollback()
+            return None
+
+        await extend_subscription(session, user_id, row.duration_days)
+        if row.uses_left == 0:
+            await session.execute(delete(Promocode).where(Promocode.code == code, Promocode.uses_left == 0))
+        await session.commit()
+    except SQLAlchemyError:
+        await session.rollback()
+        raise
+    return row.duration_days
 
-    promocode = await session.get(Promocode, code.upper())
-    if not promocode or promocode.uses_left <= 0:
-        return None
 
-    duration = promocode.duration_days
-    await add_subscriber_with_duration(session, user_id, duration)
 
-    promocode.uses_left -= 1
-    if promocode.uses_left == 0:
-        await session.delete(promocode)
+async def _activate_welcome_promocode(session: AsyncSession, user_id: int, code: str) -> int | None:
+    """Активирует приветственный промокод (без строки в promocodes): журнал + продление."""
+    from db.subscribers import extend_subscription
 
-    await session.commit()
-    return duration
+    try:
+        if not await _record_redemption(session, code, user_id):
+            await session.rollback()
+            return None
+        await extend_subscription(session, user_id, WELCOME_PROMO_DAYS)
+        await session.commit()
+    except SQLAlchemyError:
+        await session.rollback()
+        raise
+    return WELCOME_PROMO_DAYS
+
+
+async def _record_redemption(session: AsyncSession, code: str, user_id: int) -> bool:
+    """Пишет активацию в журнал; False — пользователь уже активировал этот код."""
+    inserted = await session.scalar(
+        insert(PromocodeRedemption)
+        .values(code=code, user_id=user_id)
+        .on_conflict_do_nothing(index_elements=[PromocodeRedemption.code, PromocodeRedemption.user_id])
+        .returning(PromocodeRedemption.code)
+    )
+    return inserted is not None
+
+
+async def count_redemptions(
+    session: AsyncSession,
+    *,
+    since: datetime.datetime | None = None,
+    code_prefix: str | None = None,
+) -> int:
+    """
+    Количество активаций (по индексу redeemed_at), опционально начиная с `since`
+    и только для кодов с префиксом `code_prefix` (например, "WELCOME").
+    """
+    query = select(func.count()).select_from(PromocodeRedemption)
+    if since is not None:
+        query = query.where(PromocodeRedemption.redeemed_at >= since)
+    if code_prefix:
+        query = query.where(PromocodeRedemption.code.startswith(code_prefix.upper(), autoescape=True))
+    return await session.scalar(query) or 0
 
 
 
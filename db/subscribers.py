@@ -1,4 +1,6 @@
-from datetime import datetime, timedelta, timezone
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 from sqlalchemy import (
     Column,
     DateTime,
@@ -10,9 +12,15 @@ from sqlalchemy import (
     func,
     select,
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.base import Base
+from db.base import Base, get_session
+from db.metrics import bump_daily_metrics
+
+PAID_STATUS_TTL = 600  # сек, сколько доверять найденной активной подписке (не дольше её срока)
+PAID_STATUS_NEGATIVE_TTL = 30  # сек, отсутствие подписки (продление в другом процессе видно не позже)
+PAID_STATUS_CACHE_SIZE = 100_000
 
 
 class Subscriber(Base):
@@ -24,7 +32,7 @@ class Subscriber(Base):
     """
     __tablename__ = 'subscribers'
     user_id = Column(BigInteger, ForeignKey('users.id', ondelete="CASCADE"), primary_key=True)
-    expire_at = Column(DateTime(timezone=True), nullable=False)
+    expire_at = Column(DateTime(timezone=True), nullable=False, index=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     def __repr__(self) -> str:
@@ -64,28 +72,78 @@ async def get_or_create_subscriber(session: AsyncSession, user_id: int) -> Subsc
         await session.commit()
     return subscriber
 
-async def add_subscriber_with_duration(session: AsyncSession, user_id: int, days: int) -> Subscriber:
+async def extend_subscription(
+    session: AsyncSession, user_id: int, days: int, *, bump_metrics: bool = True
+) -> datetime:
+    """
+    Продлевает активную подписку или создаёт новую (от текущего момента)
+    одним INSERT ... ON CONFLICT DO UPDATE: дата считается в БД, поэтому
+    одновременные продления (бонус + оплата) не теряют друг друга.
+    Не коммитит: вызывается в транзакции события (оплата, промокод).
+    bump_metrics=False — вызывающий сам учтёт подписку в daily_metrics.
+    Возвращает новую дату окончания подписки (UTC).
+    """
+    interval = func.make_interval(0, 0, 0, days)  # years, months, weeks, days
+    stmt = pg_insert(Subscriber).values(user_id=user_id, expire_at=func.now() + interval)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Subscriber.user_id],
+        set_={
+            "expire_at": func.greatest(Subscriber.expire_at, func.now()) + interval,
+            "updated_at": func.now(),
+        },
+    ).returning(Subscriber.expire_at)
+    expire_at = await session.scalar(stmt)
+    forget_paid_status(user_id)
+    if bump_metrics:
+        await bump_daily_metrics(session, new_subscriptions=1)
+    return expire_at
+
+
+async def add_subscriber_with_duration(session: AsyncSession, user_id: int, days: int) -> datetime:
     """
     Добавляет или продлевает подписку пользователя.
     Если подписка активна — продлевает её, иначе создаёт новую.
+    Возвращает новую дату окончания подписки (UTC).
     """
-    now = datetime.now(timezone.utc)
-    subscriber = await session.get(Subscriber, user_id)
-    base_date = now
-    if subscriber and subscriber.expire_at > now:
-        base_date = subscriber.expire_at
-    new_expire_at = base_date + timedelta(days=days)
-    if subscriber:
-        subscriber.expire_at = new_expire_at
-    else:
-        subscriber = Subscriber(user_id=user_id, expire_at=new_expire_at)
-        session.add(subscriber)
     try:
+        expire_at = await extend_subscription(session, user_id, days)
         await session.commit()
     except Exception:
         await session.rollback()
         raise
-    return subscriber
+    return expire_at
+
+
+# user_id -> (monotonic-время истечения записи, есть ли активная подписка)
+_paid_status: OrderedDict[int, tuple[float, bool]] = OrderedDict()
+
+
+def forget_paid_status(user_id: int) -> None:
+    """Сбрасывает кэш статуса подписки (после продления в этом процессе)."""
+    _paid_status.pop(user_id, None)
+
+
+async def has_active_subscription_cached(user_id: int, *, refresh: bool = False) -> bool:
+    """
+    Есть ли у пользователя активная подписка — с кэшем в памяти процесса.
+    Положительный ответ кэшируется на PAID_STATUS_TTL (но не дольше срока подписки),
+    отрицательный — на PAID_STATUS_NEGATIVE_TTL; сессия открывается только при промахе.
+    refresh=True — перечитать из БД.
+    """
+    now = time.monotonic()
+    cached = None if refresh else _paid_status.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    async with get_session() as session:
+        expire_at = await get_subscriber_expiry(session, user_id)
+    remaining = (expire_at - datetime.now(timezone.utc)).total_seconds() if expire_at else 0
+    is_paid = remaining > 0
+    ttl = min(remaining, PAID_STATUS_TTL) if is_paid else PAID_STATUS_NEGATIVE_TTL
+    _paid_status[user_id] = (now + ttl, is_paid)
+    _paid_status.move_to_end(user_id)
+    while len(_paid_status) > PAID_STATUS_CACHE_SIZE:
+        _paid_status.popitem(last=False)
+    return is_paid
 
 
 async def is_subscriber(session: AsyncSession, user_id: int) -> bool:
@@ -126,15 +184,6 @@ async def get_total_subscribers(session: AsyncSession) -> int:
     return await session.scalar(select(func.count(Subscriber.user_id)))
 
 
-async def get_subscriptions_count_for_period(session: AsyncSession, days: int) -> int:
-    """
-    Подсчитывает количество новых/продленных подписок за указанный период (в днях).
-    """
-    start_date = datetime.now(timezone.utc) - timedelta(days=days)
-    query = select(func.count(Subscriber.user_id)).where(Subscriber.updated_at >= start_date)
-    return await session.scalar(query)
-
-
 async def delete_subscriber_by_id(session: AsyncSession, user_id: int) -> None:
     """
     Удаляет подписчика по его user_id.
@@ -148,33 +197,6 @@ async def delete_subscriber_by_id(session: AsyncSession, user_id: int) -> None:
             await session.rollback()
 
 
- # --- Processed payments (idempotency) ---
-
-async def is_payment_processed(session: AsyncSession, payment_id: str) -> bool:
-    """
-    Проверяет, записан ли payment_id (уже обработан).
-    """
-    if not payment_id:
-        return False
-    result = await session.execute(
-        select(ProcessedPayment.id).where(ProcessedPayment.payment_id == payment_id)
-    )
-    return result.scalar_one_or_none() is not None
-
-async def mark_payment_processed(session: AsyncSession, payment_id: str, user_id: int) -> None:
-    """
-    Сохраняет payment_id как обработанный (игнорирует дубликат race).
-    """
-    if not payment_id:
-        return
-    if await is_payment_processed(session, payment_id):
-        return
-    session.add(ProcessedPayment(payment_id=payment_id, user_id=user_id))
-    try:
-        await session.commit()
-    except Exception:
-        await session.rollback()
-
 async def get_active_subscribers(session: AsyncSession) -> list[Subscriber]:
     """
     Возвращает список подписчиков с активной (не истекшей) подпиской.
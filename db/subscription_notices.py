@@ -0,0 +1,110 @@
+"""
+Уведомления об окончании подписки: журнал отправленных (не более одного
+уведомления каждого вида на конкретную дату окончания) и курсоры
+планировщика — до какого момента expire_at окно уже просмотрено.
+"""
+
+from datetime import datetime
+from typing import Optional, Sequence
+
+from sqlalchemy import BigInteger, Column, DateTime, String, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.base import Base
+from db.outbox import enqueue_notification
+from db.subscribers import Subscriber
+from db.users import User
+
+
+class SubscriptionNotice(Base):
+    """
+    Отправленное уведомление об окончании подписки.
+    Ключ включает expire_at: после продления и нового окончания уведомление уйдёт снова.
+    """
+    __tablename__ = 'subscription_notices'
+    user_id = Column(BigInteger, primary_key=True)
+    kind = Column(String(32), primary_key=True)
+    expire_at = Column(DateTime(timezone=True), primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self) -> str:
+        return f"<SubscriptionNotice user_id={self.user_id} kind={self.kind} expire_at={self.expire_at}>"
+
+
+class SchedulerCursor(Base):
+    """
+    Курсор фоновой задачи: все значения до position включительно уже обработаны.
+    """
+    __tablename__ = 'scheduler_cursors'
+    name = Column(String(64), primary_key=True)
+    position = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self) -> str:
+        return f"<SchedulerCursor name={self.name} position={self.position}>"
+
+
+async def get_scheduler_cursor(session: AsyncSession, name: str) -> Optional[datetime]:
+    """Позиция курсора или None, если задача ещё не запускалась."""
+    return await session.scalar(select(SchedulerCursor.position).where(SchedulerCursor.name == name))
+
+
+async def save_scheduler_cursor(session: AsyncSession, name: str, position: datetime) -> None:
+    """Сохраняет позицию курсора (upsert)."""
+    stmt = insert(SchedulerCursor).values(name=name, position=position)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SchedulerCursor.name],
+        set_={"position": stmt.excluded.position, "updated_at": func.now()},
+    )
+    await session.execute(stmt)
+    await session.commit()
+
+
+async def get_expiring_batch(
+    session: AsyncSession,
+    start: datetime,
+    end: datetime,
+    *,
+    after: Optional[tuple[datetime, int]] = None,
+    limit: int,
+) -> Sequence[Row]:
+    """
+    Подписчики (доступные пользователи) с expire_at в (start, end], по (expire_at, user_id).
+    Keyset-пагинация: after — последняя пара предыдущей страницы. Диапазон идёт по ix_subscribers_expire_at.
+    """
+    query = (
+        select(Subscriber.user_id, Subscriber.expire_at)
+        .join(User, User.id == Subscriber.user_id)
+        .where(Subscriber.expire_at > start, Subscriber.expire_at <= end, User.is_reachable.is_(True))
+        .order_by(Subscriber.expire_at, Subscriber.user_id)
+        .limit(limit)
+    )
+    if after is not None:
+        query = query.where(tuple_(Subscriber.expire_at, Subscriber.user_id) > tuple_(*after))
+    return (await session.execute(query)).all()
+
+
+async def enqueue_subscription_notices(
+    session: AsyncSession, kind: str, rows: Sequence[Row]
+) -> int:
+    """
+    Записывает уведомления вида kind (db.outbox.OUTBOX_SUBSCRIPTION_*) в журнал
+    (ON CONFLICT DO NOTHING) и ставит в outbox только новые — в одной транзакции,
+    поэтому каждое уведомление попадает в очередь один раз.
+    Возвращает количество поставленных в очередь.
+    """
+    if not rows:
+        return 0
+    stmt = (
+        insert(SubscriptionNotice)
+        .values([{"user_id": r.user_id, "kind": kind, "expire_at": r.expire_at} for r in rows])
+        .on_conflict_do_nothing()
+        .returning(SubscriptionNotice.user_id, SubscriptionNotice.expire_at)
+    )
+    inserted = (await session.execute(stmt)).all()
+    for r in inserted:
+        enqueue_notification(session, kind, {"user_id": r.user_id, "expire_at": r.expire_at.isoformat()})
+    await session.commit()
+    return len(inserted)
@@ -1,8 +1,13 @@
+from dataclasses import dataclass
+
 from sqlalchemy import Column, Integer, String, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 
 from db.base import Base
+from db.versions import VersionedSnapshot, bump_cache_version
+
+TARIFFS_CACHE = "tariffs"
 
 
 class Tariff(Base):
@@ -23,6 +28,24 @@ class Tariff(Base):
         return f"<Tariff id={self.id} name={self.name} price={self.price} duration_days={self.duration_days}>"
 
 
+@dataclass(frozen=True, slots=True)
+class TariffCatalog:
+    """Снимок всех тарифов: список по цене и индекс по ID."""
+    tariffs: tuple[Tariff, ...]
+    by_id: dict[int, Tariff]
+
+
+async def _load_catalog(session: AsyncSession) -> TariffCatalog:
+    result = await session.execute(select(Tariff).order_by(Tariff.price))
+    tariffs = tuple(result.scalars().all())
+    for tariff in tariffs:  # отвязываем от сессии: снимок разделяется между запросами
+        session.expunge(tariff)
+    return TariffCatalog(tariffs=tariffs, by_id={t.id: t for t in tariffs})
+
+
+_catalog: VersionedSnapshot[TariffCatalog] = VersionedSnapshot(TARIFFS_CACHE, _load_catalog)
+
+
 async def create_tariff(
     session: AsyncSession, name: str, price: int, duration_days: int
 ) -> Tariff:
@@ -32,11 +55,14 @@ async def create_tariff(
     new_tariff = Tariff(name=name, price=price, duration_days=duration_days)
     session.add(new_tariff)
     try:
+        await bump_cache_version(session, TARIFFS_CACHE)
         await session.commit()
         await session.refresh(new_tariff)
     except SQLAlchemyError:
         await session.rollback()
         raise
+    finally:
+        _catalog.invalidate()
     return new_tariff
 
 
@@ -61,11 +87,14 @@ async def update_tariff(
     if duration_days is not None:
         tariff.duration_days = duration_days
     try:
+        await bump_cache_version(session, TARIFFS_CACHE)
         await session.commit()
         await session.refresh(tariff)
     except SQLAlchemyError:
         await session.rollback()
         raise
+    finally:
+        _catalog.invalidate()
     return tariff
 
 
@@ -78,24 +107,26 @@ async def delete_tariff(session: AsyncSession, tariff_id: int) -> bool:
         return False
     try:
         await session.delete(tariff)
+        await bump_cache_version(session, TARIFFS_CACHE)
         await session.commit()
     except SQLAlchemyError:
         await session.rollback()
         return False
+    finally:
+        _catalog.invalidate()
     return True
 
 
 async def get_tariff_by_id(session: AsyncSession, tariff_id: int) -> Tariff | None:
     """
-    Получает один тариф по его ID.
+    Получает один тариф по его ID (из кэша каталога).
     """
-    return await session.get(Tariff, tariff_id)
+    return (await _catalog.get(session)).by_id.get(tariff_id)
 
 
 async def get_all_tariffs(session: AsyncSession) -> list[Tariff]:
     """
-    Получает все тарифы из базы данных, отсортированные по цене по возрастанию.
+    Получает все тарифы, отсортированные по цене по возрастанию (из кэша каталога).
+    Каталог перечитывается из БД только после изменения тарифов (см. db.versions).
     """
-    query = select(Tariff).order_by(Tariff.price)
-    result = await session.execute(query)
-    return list(result.scalars().all())
+    return list((await _catalog.get(session)).tariffs)
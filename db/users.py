@@ -1,14 +1,28 @@
 import datetime
-from typing import Optional
-
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, BigInteger, String, Boolean, func, select
+from collections import Counter
+from typing import AsyncIterator, Iterable, Optional
+
+from sqlalchemy import (
+    Column, Date, DateTime, ForeignKey, Index, Integer, BigInteger, String, Boolean, UniqueConstraint,
+    exists, func, literal_column, select, update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import aliased, relationship
 from sqlalchemy.exc import SQLAlchemyError
 
-from db.base import Base
+from db.base import Base, get_session
+from db.metrics import bump_daily_metrics, utc_today
 from db.subscribers import Subscriber
 
+# Аудитории рассылок
+AUDIENCE_ALL = "all"                  # все пользователи
+AUDIENCE_ADS = "ads"                  # без активной подписки и не VIP
+AUDIENCE_NEVER_PAID = "never_paid"    # ни разу не оплачивали
+
+AUDIENCE_BATCH_SIZE = 1000
+VIP_REFERRALS_COUNT = 10  # уровень 4+ (см. get_referral_stats)
+
 
 class User(Base):
     """
@@ -19,6 +33,8 @@ class User(Base):
     created_at: дата регистрации
     has_paid_ever: флаг «хоть раз платил»
     first_paid_at: дата первого платежа
+    is_reachable: False, если бот заблокирован / аккаунт удалён (исключается из рассылок)
+    blocked_at: когда пользователь стал недоступен
     activities: активности пользователя
     """
     __tablename__ = 'users'
@@ -28,27 +44,42 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     has_paid_ever = Column(Boolean, nullable=False, server_default="false")
     first_paid_at = Column(DateTime(timezone=True), nullable=True)
-    referrer_id = Column(BigInteger, ForeignKey('users.id'), nullable=True)
+    referrer_id = Column(BigInteger, ForeignKey('users.id'), nullable=True, index=True)
+    is_reachable = Column(Boolean, nullable=False, server_default="true")
+    blocked_at = Column(DateTime(timezone=True), nullable=True)
     activities = relationship("UserActivity", back_populates="user", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Поиск по username без учёта регистра (get_user_by_username)
+        Index("ix_users_username_lower", func.lower(username)),
+        # Аудитория «ни разу не платили»: маленький индекс по id только для таких строк
+        Index("ix_users_never_paid", id, postgresql_where=has_paid_ever.is_(False)),
+    )
+
     def __repr__(self) -> str:
         return f"<User id={self.id} username={self.username} has_paid_ever={self.has_paid_ever}>"
 
 
 class UserActivity(Base):
     """
-    Фиксирует временные метки активности пользователя.
+    Фиксирует активность пользователя: не более одной записи на пользователя в сутки (UTC).
     id: ID активности
     user_id: ID пользователя
-    activity_date: дата активности
+    activity_date: время первой активности за день
+    activity_day: день активности (UTC), уникален в паре с user_id
     user: связь с пользователем
     """
     __tablename__ = 'user_activity'
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey('users.id'), nullable=False)
     activity_date = Column(DateTime(timezone=True), server_default=func.now())
+    activity_day = Column(Date, nullable=False, server_default=func.current_date())
     user = relationship("User", back_populates="activities")
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "activity_day", name="uq_user_activity_user_day"),
+    )
+
     def __repr__(self) -> str:
         return f"<UserActivity id={self.id} user_id={self.user_id} activity_date={self.activity_date}>"
 
@@ -70,11 +101,15 @@ async def add_or_update_user(
         if user:
             user.first_name = first_name
             user.username = username
+            # Пользователь снова пишет боту — значит, он опять доступен для рассылок
+            user.is_reachable = True
+            user.blocked_at = None
             await session.commit()
             await session.refresh(user)
         else:
             user = User(id=user_id, first_name=first_name, username=username, referrer_id=referrer_id)
             session.add(user)
+            await bump_daily_metrics(session, new_users=1)
             await session.commit()
             await session.refresh(user)
     except SQLAlchemyError:
@@ -83,6 +118,45 @@ async def add_or_update_user(
     return user
 
 
+async def upsert_user(
+    session: AsyncSession,
+    user_id: int,
+    first_name: Optional[str],
+    username: Optional[str],
+    referrer_id: Optional[int] = None,
+) -> tuple[bool, Optional[int]]:
+    """
+    Создаёт пользователя или обновляет имя/username одним INSERT ... ON CONFLICT (id) DO UPDATE.
+    referrer_id применяется только при создании (и только если такой пользователь существует).
+    Возвращает (новый ли пользователь — RETURNING xmax = 0, сохранённый referrer_id):
+    для несуществующего реферера referrer_id будет None.
+    """
+    referrer = None
+    if referrer_id is not None:
+        referrer = select(User.id).where(User.id == referrer_id).scalar_subquery()
+    stmt = pg_insert(User).values(id=user_id, first_name=first_name, username=username, referrer_id=referrer)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.id],
+        set_={
+            "first_name": stmt.excluded.first_name,
+            "username": stmt.excluded.username,
+            # Пользователь снова пишет боту — значит, он опять доступен для рассылок
+            "is_reachable": True,
+            "blocked_at": None,
+        },
+    ).returning(literal_column("xmax = 0").label("inserted"), User.referrer_id)
+    try:
+        row = (await session.execute(stmt)).one()
+        inserted = bool(row.inserted)
+        if inserted:
+            await bump_daily_metrics(session, new_users=1)
+        await session.commit()
+    except SQLAlchemyError:
+        await session.rollback()
+        raise
+    return inserted, row.referrer_id
+
+
 def get_ref_link(bot_username: str, user_id: int) -> str:
     """
     Генерирует персональную реферальную ссылку для пользователя.
@@ -91,8 +165,8 @@ def get_ref_link(bot_username: str, user_id: int) -> str:
 
 
 async def get_user_by_username(session: AsyncSession, username: str) -> User | None:
-    """Получает пользователя по его username."""
-    query = select(User).where(User.username == username)
+    """Получает пользователя по его username (без учёта регистра, индекс ix_users_username_lower)."""
+    query = select(User).where(func.lower(User.username) == username.lower())
     result = await session.execute(query)
     return result.scalars().first()
 
@@ -122,24 +196,6 @@ async def get_total_users(session: AsyncSession) -> int:
     return await session.scalar(select(func.count(User.id)))
 
 
-async def get_active_users_today(session: AsyncSession) -> int:
-    """Вычисляет количество уникальных пользователей, активных сегодня."""
-    today = datetime.date.today()
-    query = select(func.count(func.distinct(UserActivity.user_id))).where(
-        func.date(UserActivity.activity_date) == today
-    )
-    return await session.scalar(query)
-
-
-async def get_new_users_count_for_period(session: AsyncSession, days: int) -> int:
-    """
-    Подсчитывает количество новых пользователей за указанный период времени (в днях).
-    """
-    start_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
-    query = select(func.count(User.id)).where(User.created_at >= start_date)
-    return await session.scalar(query)
-
-
 async def delete_user_by_id(session: AsyncSession, user_id: int) -> bool:
     """
     Удаляет пользователя по его ID.
@@ -166,25 +222,16 @@ async def get_users_by_ids(session: AsyncSession, user_ids: list[int]) -> list[U
     return list(result.scalars().all())
 
 
-async def mark_user_has_paid(session: AsyncSession, user_id: int) -> None:
+async def set_user_paid(session: AsyncSession, user_id: int) -> None:
     """
-    Отмечает пользователя как совершившего хотя бы один платёж (идемпотентно).
+    Ставит флаг оплаты одним UPDATE (first_paid_at — только при первой оплате).
+    Не коммитит: выполняется в транзакции обработки платежа.
     """
-    now = datetime.datetime.now(datetime.timezone.utc)
-    user = await session.get(User, user_id)
-    try:
-        if user:
-            if not user.has_paid_ever:
-                user.has_paid_ever = True
-                if user.first_paid_at is None:
-                    user.first_paid_at = now
-                await session.commit()
-        else:  # На случай если где-то не был создан ранее
-            user = User(id=user_id, first_name=None, username=None, has_paid_ever=True, first_paid_at=now)
-            session.add(user)
-            await session.commit()
-    except SQLAlchemyError:
-        await session.rollback()
+    await session.execute(
+        update(User)
+        .where(User.id == user_id, User.has_paid_ever.is_(False))
+        .values(has_paid_ever=True, first_paid_at=func.coalesce(User.first_paid_at, func.now()))
+    )
 
 
 async def has_user_paid_ever(session: AsyncSession, user_id: int) -> bool:
@@ -193,46 +240,120 @@ async def has_user_paid_ever(session: AsyncSession, user_id: int) -> bool:
     return bool(user and user.has_paid_ever)
 
 
-async def get_user_ids_never_paid(session: AsyncSession) -> list[int]:
-    """Возвращает список user_id, которые ни разу не оплачивали (has_paid_ever = false)."""
-    query = select(User.id).where(User.has_paid_ever.is_(False))  # noqa: E712 SQLAlchemy сравнивает правильно
-    result = await session.execute(query)
-    return list(result.scalars().all())
-
-
 async def is_user_exists(session: AsyncSession, user_id: int) -> bool:
     """Проверяет, существует ли пользователь в базе данных."""
     user = await session.get(User, user_id)
     return user is not None
 
 
-async def get_user_ids_without_subscription(session: AsyncSession) -> list[int]:
+def _audience_filters(audience: str) -> list:
+    """Возвращает условия WHERE для аудитории рассылки (недоступные пользователи исключаются всегда)."""
+    reachable = User.is_reachable.is_(True)
+    if audience == AUDIENCE_ALL:
+        return [reachable]
+    if audience == AUDIENCE_NEVER_PAID:
+        return [reachable, User.has_paid_ever.is_(False)]
+    if audience == AUDIENCE_ADS:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        referral = aliased(User)
+        vip_ids = (
+            select(referral.referrer_id)
+            .where(referral.referrer_id.isnot(None))
+            .group_by(referral.referrer_id)
+            .having(func.count(referral.id) >= VIP_REFERRALS_COUNT)
+        )
+        return [
+            reachable,
+            ~exists().where(Subscriber.user_id == User.id, Subscriber.expire_at > now),
+            User.id.not_in(vip_ids),
+        ]
+    raise ValueError(f"Неизвестная аудитория: {audience}")
+
+
+async def count_audience(session: AsyncSession, audience: str) -> int:
+    """Подсчитывает размер аудитории рассылки."""
+    query = select(func.count(User.id)).where(*_audience_filters(audience))
+    return await session.scalar(query)
+
+
+async def iter_audience_user_ids(
+    audience: str,
+    *,
+    after_id: int | None = None,
+    batch_size: int = AUDIENCE_BATCH_SIZE,
+) -> AsyncIterator[int]:
     """
-    Возвращает список ID пользователей, у которых нет активной подписки (нет подписки или истекла).
+    Потоково отдаёт user_id аудитории по возрастанию id (keyset-пагинация: id > :last LIMIT :n).
+    Каждая страница читается в отдельной короткой сессии, чтобы долгая рассылка
+    не держала соединение и открытую транзакцию.
     """
-    now = datetime.now(datetime.timezone.utc)
-    query = (
-        select(User.id)
-        .outerjoin(Subscriber, User.id == Subscriber.user_id)
-        .where(
-            (Subscriber.user_id.is_(None)) |
-            (Subscriber.expire_at <= now)
-        )
+    filters = _audience_filters(audience)
+    last_id = after_id
+    while True:
+        query = select(User.id).where(*filters).order_by(User.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(User.id > last_id)
+        async with get_session() as session:
+            batch = list((await session.execute(query)).scalars().all())
+        for user_id in batch:
+            yield user_id
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1]
+
+
+async def mark_users_unreachable(session: AsyncSession, user_ids: list[int]) -> int:
+    """
+    Помечает пользователей недоступными (заблокировали бота, удалили аккаунт) одним UPDATE.
+    Возвращает количество обновлённых строк.
+    """
+    if not user_ids:
+        return 0
+    result = await session.execute(
+        update(User)
+        .where(User.id.in_(user_ids), User.is_reachable.is_(True))
+        .values(is_reachable=False, blocked_at=func.now())
     )
-    result = await session.execute(query)
-    return list(result.scalars().all())
+    await session.commit()
+    return result.rowcount
 
-async def log_user_activity(session: AsyncSession, user_id: int) -> None:
+
+ACTIVITY_INSERT_CHUNK = 5000  # строк на один INSERT (лимит параметров asyncpg — 32767)
+
+
+async def insert_user_activities(
+    session: AsyncSession, activities: Iterable[tuple[int, datetime.date]]
+) -> int:
     """
-    Логирует активность пользователя (создаёт запись UserActivity).
+    Записывает пары (user_id, день) многострочным INSERT ... ON CONFLICT DO NOTHING
+    и увеличивает DAU только на реально вставленные строки. Возвращает их количество.
     """
-    activity = UserActivity(user_id=user_id)
-    session.add(activity)
+    rows = [{"user_id": user_id, "activity_day": day} for user_id, day in activities]
+    inserted_per_day: Counter[datetime.date] = Counter()
     try:
+        for start in range(0, len(rows), ACTIVITY_INSERT_CHUNK):
+            stmt = (
+                pg_insert(UserActivity)
+                .values(rows[start:start + ACTIVITY_INSERT_CHUNK])
+                .on_conflict_do_nothing(index_elements=[UserActivity.user_id, UserActivity.activity_day])
+                .returning(UserActivity.activity_day)
+            )
+            inserted_per_day.update((await session.execute(stmt)).scalars().all())
+        for day, count in inserted_per_day.items():
+            await bump_daily_metrics(session, day=day, dau=count)
         await session.commit()
     except SQLAlchemyError:
         await session.rollback()
         raise
+    return sum(inserted_per_day.values())
+
+
+async def log_user_activity(session: AsyncSession, user_id: int) -> None:
+    """
+    Логирует активность пользователя сразу (без буфера).
+    В горячих путях используйте utils.activity.activity_buffer.record().
+    """
+    await insert_user_activities(session, [(user_id, utc_today())])
 
 
 async def get_top_referrers(session: AsyncSession, limit: int = 10):
@@ -0,0 +1,95 @@
+"""
+Версии редко меняющихся справочников (тарифы, каналы) для in-process кэшей.
+Запись в справочник увеличивает версию в той же транзакции; каждый процесс
+сверяет версию не чаще раза в CACHE_VERSION_CHECK_INTERVAL секунд и
+перечитывает справочник только при её изменении.
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from sqlalchemy import BigInteger, Column, DateTime, String, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.base import Base
+
+CACHE_VERSION_CHECK_INTERVAL = 30  # секунд
+
+T = TypeVar("T")
+
+
+class CacheVersion(Base):
+    """
+    Счётчик версии справочника.
+    name: имя справочника
+    version: увеличивается при каждом изменении
+    """
+    __tablename__ = 'cache_versions'
+    name = Column(String(64), primary_key=True)
+    version = Column(BigInteger, nullable=False, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self) -> str:
+        return f"<CacheVersion name={self.name} version={self.version}>"
+
+
+async def bump_cache_version(session: AsyncSession, name: str) -> None:
+    """Увеличивает версию справочника. Не коммитит: вызывается в транзакции изменения."""
+    stmt = insert(CacheVersion).values(name=name, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CacheVersion.name],
+        set_={"version": CacheVersion.version + 1, "updated_at": func.now()},
+    )
+    await session.execute(stmt)
+
+
+async def get_cache_version(session: AsyncSession, name: str) -> int:
+    """Текущая версия справочника (0, если он ещё не менялся)."""
+    version = await session.scalar(select(CacheVersion.version).where(CacheVersion.name == name))
+    return version or 0
+
+
+class VersionedSnapshot(Generic[T]):
+    """Снимок справочника в памяти процесса, сверяемый с версией в БД.
+
+    Пока проверка версии свежая, `get` не обращается к БД. Изменения из этого
+    процесса видны сразу (`invalidate`), из других — не позже `check_interval`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[AsyncSession], Awaitable[T]],
+        check_interval: float = CACHE_VERSION_CHECK_INTERVAL,
+    ):
+        self.name = name
+        self.loader = loader
+        self.check_interval = check_interval
+        self._value: Optional[T] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._version is not None and time.monotonic() - self._checked_at < self.check_interval
+
+    async def get(self, session: AsyncSession) -> T:
+        """Возвращает снимок; при устаревшей проверке сверяет версию и при необходимости перечитывает."""
+        if self._fresh():
+            return self._value  # type: ignore[return-value]
+        async with self._lock:
+            if self._fresh():
+                return self._value  # type: ignore[return-value]
+            version = await get_cache_version(session, self.name)
+            if version != self._version:
+                self._value = await self.loader(session)
+                self._version = version
+            self._checked_at = time.monotonic()
+            return self._value  # type: ignore[return-value]
+
+    def invalidate(self) -> None:
+        """Сбрасывает снимок (после изменения справочника в этом процессе)."""
+        self._value = None
+        self._version = None
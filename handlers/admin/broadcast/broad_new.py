@@ -3,11 +3,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.exceptions import TelegramAPIError
-import asyncio
 from contextlib import suppress
 import logging
 from utils.keyboards import back_button
-from config import BROADCAST_PROGRESS_UPDATE_INTERVAL, BROADCAST_PER_MESSAGE_DELAY
+from db.users import AUDIENCE_NEVER_PAID
+from utils.broadcast import BroadcastMessage, start_broadcast_job
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -153,83 +153,16 @@ async def send_broadcast_trial(callback: CallbackQuery, state: FSMContext, bot:
         await callback.answer("❗️ Пустое сообщение.", show_alert=True)
         return
     await callback.message.edit_text("⏳ Рассылка началась! По завершении придёт отчёт.", reply_markup=back_button())
-    asyncio.create_task(_send_task(bot, callback.from_user.id, data))
+    await start_broadcast_job(bot, callback.from_user.id, AUDIENCE_NEVER_PAID, BroadcastMessage.from_state(data))
     await state.clear()
     await callback.answer()
 
-async def _send_task(bot: Bot, admin_id: int, data: dict):
-    """Выполняет массовую отправку сообщений новым пользователям."""
-    from db.base import get_session
-    from db.users import get_user_ids_never_paid
-    text = data.get("text")
-    markup = _make_markup(data.get("button_text"), data.get("button_url"))
-    media_id, media_type = data.get("media_id"), data.get("media_type")
-    sent = failed = 0
-    async with get_session() as session:
-        user_ids = await get_user_ids_never_paid(session)
-    if not user_ids:
-        await bot.send_message(admin_id, "❗️ Аудитория пуста. Сообщение никому не отправлено.")
-        return
-    total = len(user_ids)
-    logger.info(f"🚀 [TRIAL-BROADCAST] Начинается рассылка для {total} пользователей.")
-    progress_msg = await bot.send_message(admin_id, _render_progress_bar(0, total))
-    last_update = asyncio.get_event_loop().time()
-    for user_id in user_ids:
-        try:
-            if media_id and media_type == "photo":
-                await bot.send_photo(user_id, media_id, caption=text, reply_markup=markup)
-            elif media_id and media_type == "video":
-                await bot.send_video(user_id, media_id, caption=text, reply_markup=markup)
-            else:
-                await bot.send_message(user_id, text, reply_markup=markup)
-            sent += 1
-        except TelegramAPIError as e:
-            error_text = str(e)
-            logger.info("🚫 [TRIAL-BROADCAST] TelegramAPIError (%s)", error_text)
-            failed += 1
-        except Exception as e:
-            logger.error("🚫 [TRIAL-BROADCAST] Неизвестная ошибка при отправке пользователю %s: %s", user_id, e, exc_info=True)
-            failed += 1
-        now = asyncio.get_event_loop().time()
-        if (sent % 100 == 0 or sent == total) or (now - last_update > BROADCAST_PROGRESS_UPDATE_INTERVAL):
-            with suppress(TelegramAPIError):
-                await bot.edit_message_text(
-                    text=_render_progress_bar(sent, total),
-                    chat_id=admin_id,
-                    message_id=progress_msg.message_id
-                )
-            last_update = now
-        await asyncio.sleep(BROADCAST_PER_MESSAGE_DELAY)
-
-    logger.info("✅ [TRIAL-BROADCAST] Рассылка завершена. Отправлено=%s Ошибок=%s", sent, failed)
-    percent = int(sent / total * 100) if total else 0
-    summary_text = (
-        f"💳 [TRIAL-РАССЫЛКА] Завершена!\n\n"
-        f"🧑‍🎓 Новых пользователей: {total}\n"
-        f"✅ Доставлено: {sent} ({percent}%)\n"
-        f"❗️ Не доставлено: {failed}"
-    )
-    with suppress(TelegramAPIError):
-        await bot.edit_message_text(
-            text=_render_progress_bar(sent, total),
-            chat_id=admin_id,
-            message_id=progress_msg.message_id
-        )
-    await bot.send_message(admin_id, summary_text, parse_mode="Markdown")
-
 def _make_markup(button_text, button_url):
     """Создаёт InlineKeyboardMarkup для кнопки, если задана."""
     if button_text and button_url:
         return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text=button_text, url=button_url)]])
     return None
 
-def _render_progress_bar(sent, total, bar_length=10):
-    """Рендерит прогресс-бар рассылки."""
-    percent = sent / total if total else 0
-    filled = int(bar_length * percent)
-    bar = '🟩' * filled + '⬜' * (bar_length - filled)
-    return f"Прогресс: [{bar}] {int(percent*100)}% ({sent}/{total})"
-
 async def _cleanup(message: Message, state: FSMContext, bot: Bot):
     """Удаляет временные сообщения и обновляет конструктор."""
     data = await state.get_data()
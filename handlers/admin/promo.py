@@ -1,23 +1,31 @@
+import csv
+import io
+import re
+import time
+from datetime import datetime, timedelta, timezone
 from math import ceil
 from aiogram.filters.callback_data import CallbackData
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery
+from aiogram.types import BufferedInputFile, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from utils.keyboards import pagination_keyboard
 import logging
 from config import ADMINS
 from db.base import get_session
-from db.promocodes import (add_promocode, get_all_promocodes,
-                           remove_all_promocodes, remove_promocode)
+from db.promocodes import (add_promocode, count_redemptions, create_promocodes_bulk,
+                           get_all_promocodes, remove_all_promocodes, remove_promocode)
 from states.promo import PromoStates
 
 
 router = Router()
 
 PROMOCODES_PER_PAGE = 20
+BULK_MAX_COUNT = 100_000
+BULK_CODE_LENGTH = 8
+BULK_PREFIX_RE = re.compile(r"^[A-Za-z0-9]{1,16}$")
 class PromoPageCallback(CallbackData, prefix="promo_page"):
     """
     Управление промокодами в админ-панели: добавление, удаление, просмотр и массовое очищение.
@@ -32,6 +40,7 @@ def get_promo_menu_keyboard():
     builder = InlineKeyboardBuilder()
     builder.row(InlineKeyboardButton(text="➕ Добавить промокод", callback_data="add_promocode"))
     builder.row(InlineKeyboardButton(text="➖ Удалить промокод", callback_data="remove_promocode"))
+    builder.row(InlineKeyboardButton(text="📦 Сгенерировать пачку", callback_data="bulk_promocodes"))
     builder.row(InlineKeyboardButton(text="🎟️ Посмотреть все", callback_data="all_promocodes"))
     builder.row(InlineKeyboardButton(text="🗑️ Удалить все", callback_data="remove_all_promocodes"))
     builder.row(InlineKeyboardButton(text="⬅️ Назад в меню", callback_data="admin_menu"))
@@ -41,8 +50,12 @@ async def show_promo_menu(callback: CallbackQuery) -> None:
     """
     Отображает главное меню управления промокодами с дружелюбным приветствием.
     """
+    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
+    async with get_session() as session:
+        redeemed_week = await count_redemptions(session, since=week_ago)
     await callback.message.edit_text(
-        "<b>🎟️ Меню управления промокодами</b>\n\nВыберите действие:",
+        "<b>🎟️ Меню управления промокодами</b>\n\n"
+        f"🎯 Активаций за 7 дней: <b>{redeemed_week}</b>\n\nВыберите действие:",
         parse_mode="HTML",
         reply_markup=get_promo_menu_keyboard()
     )
@@ -108,6 +121,80 @@ async def process_add_promocode(message: types.Message, state: FSMContext) -> No
             parse_mode="HTML"
         )
 
+@router.callback_query(F.data == "bulk_promocodes")
+async def bulk_promocodes_start(callback: CallbackQuery, state: FSMContext) -> None:
+    """
+    Запускает пакетную генерацию промокодов для кампаний.
+    """
+    await callback.message.answer(
+        "<b>📦 Пакетная генерация промокодов</b>\n\n"
+        "<b>Формат:</b> <code>КОЛ-ВО ДНИ [ПРЕФИКС]</code>\n\n"
+        f"• <code>КОЛ-ВО</code> — сколько кодов создать (до {BULK_MAX_COUNT}).\n"
+        "• <code>ДНИ</code> — срок подписки по коду.\n"
+        "• <code>ПРЕФИКС</code> — необязательно, латиница/цифры (коды вида <code>SUMMER-7KQ2M9XA</code>).\n\n"
+        "<b>Пример:</b> <code>50000 30 SUMMER</code>\n\n"
+        "Каждый код одноразовый. Результат придёт CSV-файлом.",
+        parse_mode="HTML"
+    )
+    await state.set_state(PromoStates.bulk)
+    await callback.answer()
+
+@router.message(PromoStates.bulk)
+async def process_bulk_promocodes(message: types.Message, state: FSMContext) -> None:
+    """
+    Генерирует пачку промокодов и отправляет их CSV-файлом.
+    """
+    if message.from_user.id not in ADMINS or not message.text:
+        await state.clear()
+        return
+
+    parts = message.text.strip().split()
+    prefix = parts[2] if len(parts) == 3 else ""
+    if (
+        len(parts) not in (2, 3)
+        or not parts[0].isdigit() or not parts[1].isdigit()
+        or not 0 < int(parts[0]) <= BULK_MAX_COUNT or int(parts[1]) <= 0
+        or (prefix and not BULK_PREFIX_RE.match(prefix))
+    ):
+        await message.answer(
+            "❗️ <b>Неверный формат.</b> Пример: <code>50000 30 SUMMER</code>",
+            parse_mode="HTML"
+        )
+        return
+    count, days = int(parts[0]), int(parts[1])
+
+    await state.clear()
+    status = await message.answer(f"⏳ Генерирую {count} промокодов...")
+    started = time.monotonic()
+    try:
+        async with get_session() as session:
+            codes = await create_promocodes_bulk(
+                session, count, days, length=BULK_CODE_LENGTH, prefix=prefix
+            )
+    except Exception:
+        logging.exception(f"❌ [PROMO] Ошибка пакетной генерации ({count} шт.) админом {message.from_user.id}")
+        await status.edit_text("❌ Не удалось сгенерировать промокоды. Подробности в логах.")
+        return
+    elapsed = time.monotonic() - started
+
+    csv_buffer = io.StringIO()
+    writer = csv.writer(csv_buffer, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(["code", "duration_days", "uses_left"])
+    writer.writerows((code, days, 1) for code in codes)
+    filename = f"promocodes_{prefix.upper() or 'bulk'}_{datetime.now():%Y%m%d_%H%M%S}.csv"
+    document = BufferedInputFile(csv_buffer.getvalue().encode("utf-8"), filename=filename)
+
+    logging.info(
+        f"📦 [PROMO] Админ {message.from_user.id} сгенерировал {len(codes)} промокодов "
+        f"({days} дн., префикс {prefix or '—'}) за {elapsed:.1f} с"
+    )
+    await status.delete()
+    await message.answer_document(
+        document,
+        caption=f"✅ Создано <b>{len(codes)}</b> промокодов на {days} дн. за {elapsed:.1f} с",
+        parse_mode="HTML",
+    )
+
 @router.callback_query(F.data.startswith("remove_promocode_page"))
 async def remove_promocode_page(callback: CallbackQuery, state: FSMContext) -> None:
     """
@@ -4,16 +4,7 @@ from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder, InlineKeyboardButton
 
 import logging
-from db.base import get_session
-from db.promocodes import get_active_promocodes_count
-from db.subscribers import (
-    get_subscriptions_count_for_period,
-    get_total_subscribers,
-)
-from db.users import (
-    get_active_users_today,
-    get_new_users_count_for_period, get_total_users
-)
+from db.stats import get_cached_dashboard_stats
 
 
 router = Router()
@@ -24,23 +15,8 @@ async def handle_stats(callback: CallbackQuery) -> None:
     Собирает, форматирует и отображает расширенную статистику по боту с дружелюбным тоном и эмодзи.
     """
     try:
-        async with get_session() as session:
-            # --- Общая статистика ---
-            total_users = await get_total_users(session)
-            total_subscribers = await get_total_subscribers(session)
-            active_promos = await get_active_promocodes_count(session)
-
-            # --- Активность пользователей ---
-            active_today = await get_active_users_today(session)
-            new_today = await get_new_users_count_for_period(session, days=1)
-            new_week = await get_new_users_count_for_period(session, days=7)
-            new_month = await get_new_users_count_for_period(session, days=30)
-
-            # --- Динамика подписок ---
-            subs_today = await get_subscriptions_count_for_period(session, days=1)
-            subs_week = await get_subscriptions_count_for_period(session, days=7)
-            subs_month = await get_subscriptions_count_for_period(session, days=30)
-
+        # Один агрегированный запрос, результат кэшируется на STATS_CACHE_TTL секунд
+        stats = await get_cached_dashboard_stats()
     except Exception as e:
         logging.error(f"Ошибка при получении статистики: {e}", exc_info=True)
         await callback.answer(
@@ -49,7 +25,7 @@ async def handle_stats(callback: CallbackQuery) -> None:
         )
         return
 
-    sub_percentage = (total_subscribers / total_users * 100) if total_users > 0 else 0
+    sub_percentage = (stats.total_subscribers / stats.total_users * 100) if stats.total_users > 0 else 0
 
     text = (
         "<b>📊 Статистика SaverBot</b>\n\n"
@@ -57,25 +33,25 @@ async def handle_stats(callback: CallbackQuery) -> None:
         "<b>💎 Подписчики:</b> <b>{total_subscribers}</b> ({sub_percentage:.2f}%)\n"
         "<b>🎟️ Активных промокодов:</b> <b>{active_promos}</b>\n\n"
         "<b>🟢 Активны сегодня:</b> <b>{active_today}</b>\n"
-        "<b>➕ Новых за 24ч:</b> <b>{new_today}</b>\n"
+        "<b>➕ Новых сегодня:</b> <b>{new_today}</b>\n"
         "<b>➕ Новых за 7д:</b> <b>{new_week}</b>\n"
         "<b>➕ Новых за 30д:</b> <b>{new_month}</b>\n\n"
         "<b>📈 Подписки:</b>\n"
-        " └ За 24ч: <b>{subs_today}</b>\n"
+        " └ Сегодня: <b>{subs_today}</b>\n"
         " └ За 7д: <b>{subs_week}</b>\n"
         " └ За 30д: <b>{subs_month}</b>\n\n"
     ).format(
-        total_users=total_users,
-        total_subscribers=total_subscribers,
+        total_users=stats.total_users,
+        total_subscribers=stats.total_subscribers,
         sub_percentage=sub_percentage,
-        active_promos=active_promos,
-        active_today=active_today,
-        new_today=new_today,
-        new_week=new_week,
-        new_month=new_month,
-        subs_today=subs_today,
-        subs_week=subs_week,
-        subs_month=subs_month,
+        active_promos=stats.active_promos,
+        active_today=stats.active_today,
+        new_today=stats.new_today,
+        new_week=stats.new_week,
+        new_month=stats.new_month,
+        subs_today=stats.subs_today,
+        subs_week=stats.subs_week,
+        subs_month=stats.subs_month,
     )
 
     builder = InlineKeyboardBuilder()
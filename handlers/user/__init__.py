@@ -1,4 +1,3 @@
-
 from .about import router as about_router
 from .start import router as start_router
 from .promo import router as promo_router
@@ -7,6 +6,7 @@ from .myprofile import router as myprofile_router
 from .menu import router as menu_router
 from .referral import router as referral_router
 from .referral_info import router as referral_info_router
+from .channel_guard import router as channel_guard_router, setup_channel_guard
 
 routers = [
     about_router,
@@ -16,5 +16,15 @@ routers = [
     myprofile_router,
     menu_router,
     referral_router,
-    referral_info_router
+    referral_info_router,
+    channel_guard_router,
 ]
+
+# /start, оплата и промокоды доступны всегда: через них снимается ограничение
+setup_channel_guard([
+    about_router,
+    myprofile_router,
+    menu_router,
+    referral_router,
+    referral_info_router,
+])
@@ -0,0 +1,111 @@
+"""
+Ограничение доступа без подписки на обязательные каналы (channel_guard):
+middleware для пользовательских роутеров и кнопка «Проверить снова».
+"""
+import logging
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Sequence
+
+from aiogram import BaseMiddleware, F, Router
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message, TelegramObject
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+from config import ADMINS
+from db.base import get_session
+from db.channels import Channel, check_user_memberships, get_channel_guard_snapshot
+from db.subscribers import has_active_subscription_cached
+from .menu import MAIN_MENU_TEXT, get_main_menu_keyboard
+
+logger = logging.getLogger(__name__)
+
+router = Router()
+
+GUARD_RECHECK = "channel_guard_recheck"
+GUARD_TEXT = (
+    "<b>📢 Подпишитесь на наши каналы</b>\n\n"
+    "Чтобы пользоваться ботом бесплатно, подпишитесь на каналы ниже и нажмите «Проверить снова».\n"
+    "С оплаченной подпиской ограничение не действует."
+)
+
+def _guard_keyboard(channels: Sequence[Channel]) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for ch in channels:
+        builder.button(text=f"📢 {ch.title or '@' + ch.username}", url=f"https://t.me/{ch.username}")
+    builder.button(text="🔁 Проверить снова", callback_data=GUARD_RECHECK)
+    builder.button(text="💳 Подписка", callback_data="subscribe")
+    builder.adjust(1)
+    return builder.as_markup()
+
+
+async def _missing_channels(bot, user_id: int, *, refresh: bool = False) -> list[Channel]:
+    """Обязательные каналы, на которые пользователь не подписан ([] — доступ открыт)."""
+    async with get_session() as session:  # соединение берётся только при сверке версии снимка
+        snapshot = await get_channel_guard_snapshot(session)
+    if not snapshot.enabled or not snapshot.channels:
+        return []
+    if await has_active_subscription_cached(user_id, refresh=refresh):
+        return []
+    results = await check_user_memberships(bot, user_id, snapshot.channels, refresh=refresh)
+    return [r.channel for r in results if not r.is_member]
+
+
+class ChannelGuardMiddleware(BaseMiddleware):
+    """Пропускает апдейт к хендлеру, только если пользователь подписан на все обязательные каналы.
+
+    Флаг и список каналов берутся из снимка в памяти, членство и статус оплаты
+    (в том числе отрицательные ответы) — из TTL-кэшей, поэтому повторные апдейты
+    пользователя не делают запросов к БД и Telegram. Оплата в другом процессе
+    видна не позже PAID_STATUS_NEGATIVE_TTL, по кнопке «Проверить снова» — сразу.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        if user is None or user.id in ADMINS or (chat is not None and chat.type != "private"):
+            return await handler(event, data)
+
+        missing = await _missing_channels(data["bot"], user.id)
+        if not missing:
+            return await handler(event, data)
+
+        logger.debug("🔒 [GUARD] user=%s не подписан на %s каналов", user.id, len(missing))
+        with suppress(TelegramAPIError):
+            if isinstance(event, CallbackQuery):
+                await event.answer()
+                if event.message:
+                    await event.message.answer(GUARD_TEXT, reply_markup=_guard_keyboard(missing))
+            elif isinstance(event, Message):
+                await event.answer(GUARD_TEXT, reply_markup=_guard_keyboard(missing))
+        return None
+
+
+def setup_channel_guard(routers: Sequence[Router]) -> None:
+    """Подключает ограничение к сообщениям и колбэкам переданных роутеров."""
+    guard = ChannelGuardMiddleware()
+    for r in routers:
+        r.message.middleware(guard)
+        r.callback_query.middleware(guard)
+
+
+@router.callback_query(F.data == GUARD_RECHECK)
+async def recheck_channels(callback: CallbackQuery) -> None:
+    """Повторная проверка подписки (без учёта кэша отрицательных результатов)."""
+    missing = await _missing_channels(callback.bot, callback.from_user.id, refresh=True)
+    if missing:
+        await callback.answer("❌ Подписка найдена не на все каналы.", show_alert=True)
+        with suppress(TelegramAPIError):
+            await callback.message.edit_reply_markup(reply_markup=_guard_keyboard(missing))
+        return
+    with suppress(TelegramAPIError):
+        await callback.message.edit_text(
+            MAIN_MENU_TEXT.format(username=callback.from_user.username),
+            reply_markup=get_main_menu_keyboard(),
+            parse_mode="HTML",
+        )
+    await callback.answer("✅ Спасибо за подписку!")
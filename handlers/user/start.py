@@ -3,48 +3,24 @@
 
 import logging
 
-import random
 from typing import Optional
 
 from aiogram import Router, types
 from aiogram.filters import Command
 
 from db.base import get_session
-from db.promocodes import add_promocode, get_promocode
-from db.users import add_or_update_user, is_user_exists, log_user_activity
+from db.promocodes import WELCOME_PROMO_DAYS, welcome_promocode
+from db.users import upsert_user
 from db.subscribers import add_subscriber_with_duration
 from handlers.user.referral import get_referral_stats
+from utils.activity import activity_buffer
 from config import SUBSCRIPTION_LIFETIME_DAYS, SUPPORT_GROUP_ID, NEW_USER_TOPIC_ID
 
 
 logger = logging.getLogger(__name__)
 
-PROMO_DURATION_DAYS = 7
-PROMO_PREFIX = "WELCOME"
-PROMO_RANDOM_MIN = 100_000
-PROMO_RANDOM_MAX = 999_999
-PROMO_MAX_TRIES = 5
-
 router = Router()
 
-async def _generate_unique_promocode(session, tries: int = PROMO_MAX_TRIES) -> str | None:
-    """
-    Пытается создать и сохранить уникальный промокод, возвращает код или None.
-    Проверяем коллизии через запрос существующего кода (быстро и просто).
-    """
-    for attempt in range(1, tries + 1):
-        code = f"{PROMO_PREFIX}-{random.randint(PROMO_RANDOM_MIN, PROMO_RANDOM_MAX)}"
-        exists = await get_promocode(session, code)
-        if exists:
-            continue
-        await add_promocode(session, code, duration_days=PROMO_DURATION_DAYS)
-        return code
-    logger.warning(
-        "⚠️ [START] Не удалось сгенерировать уникальный промокод после %d попыток", tries
-    )
-    return None
-
-
 
 @router.message(Command("start"))
 async def cmd_start(message: types.Message) -> None:
@@ -78,12 +54,12 @@ async def cmd_start(message: types.Message) -> None:
             pass
 
     async with get_session() as session:
-        is_new = not await is_user_exists(session, user_id)
-        # referrer_id только для новых пользователей
-        user = await add_or_update_user(
-            session, user_id, first_name=first_name, username=message.from_user.username, referrer_id=referrer_id if is_new else None
+        # Один round trip: upsert сообщает, новый ли пользователь, и какой реферер реально сохранён
+        # (referrer_id применяется только к новым и только если реферер существует — иначе None)
+        is_new, referrer_id = await upsert_user(
+            session, user_id, first_name=first_name, username=message.from_user.username, referrer_id=referrer_id
         )
-        await log_user_activity(session, user_id)
+        activity_buffer.record(user_id)
         if is_new:
             logger.info("👤 [START] Новый пользователь %s (id=%s, referrer_id=%s) зарегистрирован", username_raw, user_id, referrer_id)
             await message.bot.send_message(
@@ -92,7 +68,7 @@ async def cmd_start(message: types.Message) -> None:
                 message_thread_id=NEW_USER_TOPIC_ID
             )
             
-            promo_code = await _generate_unique_promocode(session)
+            promo_code = welcome_promocode(user_id)  # без записи в БД: код проверяется по HMAC
             # --- Бонус за реферала: +3 дня подписки рефереру ---
             if referrer_id:
                 try:
@@ -137,7 +113,7 @@ async def cmd_start(message: types.Message) -> None:
     if is_new:
         if promo_code:
             promo_text = (
-                f"Подарок новому пользователю, промокод на {PROMO_DURATION_DAYS} дней подписки: "
+                f"Подарок новому пользователю, промокод на {WELCOME_PROMO_DAYS} дней подписки: "
                 f"<pre>{promo_code}</pre>\nАктивируй его через меню профиля (/profile).\n\n"
             )
         else:
@@ -94,8 +94,8 @@ async def payment_callback_handler(callback: types.CallbackQuery) -> None:
         return
 
     try:
-        me = await callback.bot.get_me()
-        payment_url, payment_id = create_payment(
+        me = await callback.bot.me()  # кэшируется в Bot, запрашивается при старте
+        payment_url, payment_id = await create_payment(
             user_id=user_id,
             amount=tariff.price,
             description=f"Подписка: {tariff.name}",
@@ -0,0 +1,50 @@
+"""Пересчёт rollup-таблицы daily_metrics по исходным таблицам.
+Нужен один раз после появления daily_metrics (или для починки счётчиков):
+1. new_users — из users.created_at;
+2. dau — из user_activity (уникальные пользователи за день);
+3. payments — из processed_payments.created_at.
+new_subscriptions историю не восстанавливает (subscribers хранит только последнее продление) и не трогается.
+Повторный запуск безопасен: значения перезаписываются, а не прибавляются.
+"""
+from __future__ import annotations
+
+import asyncio
+from sqlalchemy import text
+
+from db.base import engine
+import db  # noqa: F401  # импорт моделей чтобы они попали в metadata
+
+_BACKFILL_SQL = {
+    "new_users": """
+        SELECT (created_at AT TIME ZONE 'UTC')::date AS day, COUNT(*) AS value
+        FROM users WHERE created_at IS NOT NULL GROUP BY 1
+    """,
+    "dau": """
+        SELECT (activity_date AT TIME ZONE 'UTC')::date AS day, COUNT(DISTINCT user_id) AS value
+        FROM user_activity WHERE activity_date IS NOT NULL GROUP BY 1
+    """,
+    "payments": """
+        SELECT (created_at AT TIME ZONE 'UTC')::date AS day, COUNT(*) AS value
+        FROM processed_payments GROUP BY 1
+    """,
+}
+
+
+async def backfill() -> None:
+    async with engine.begin() as conn:
+        for column, source in _BACKFILL_SQL.items():
+            result = await conn.execute(text(f"""
+                INSERT INTO daily_metrics (day, {column})
+                SELECT day, value FROM ({source}) AS src
+                ON CONFLICT (day) DO UPDATE SET {column} = EXCLUDED.{column}, updated_at = now()
+            """))
+            print(f"[backfill_daily_metrics] {column}: {result.rowcount} дней")
+    print("[backfill_daily_metrics] Done.")
+
+
+def main() -> None:
+    asyncio.run(backfill())
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -3,6 +3,9 @@
 1. Пытаемся прочитать alembic_version — если таблица есть, считаем что используется Alembic и просто выходим.
 2. Если таблицы alembic_version нет – создаём ВСЕ таблицы из Base.metadata (import db).
 3. Повторный запуск безопасен (create_all идемпотентно).
+4. create_all не трогает уже существующие таблицы, поэтому колонки и индексы,
+   добавленные в модели позже, создаются отдельно (ADD COLUMN IF NOT EXISTS,
+   CREATE INDEX только для отсутствующих).
 """
 from __future__ import annotations
 
@@ -29,9 +32,57 @@ async def ensure_schema() -> None:
 
         print("[ensure_schema] alembic_version отсутствует — создаём таблицы через Base.metadata.create_all()")
         await conn.run_sync(Base.metadata.create_all)
+        await _add_missing_columns(conn)
+        await _upgrade_user_activity(conn)
+        await conn.run_sync(_create_missing_indexes)
         print("[ensure_schema] Done.")
 
 
+# Колонки, появившиеся в моделях после создания таблиц
+_ADDED_COLUMNS = (
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_reachable boolean NOT NULL DEFAULT true",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS blocked_at timestamp with time zone",
+    "ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS owner varchar(64)",
+    "ALTER TABLE broadcast_jobs ADD COLUMN IF NOT EXISTS lease_until timestamp with time zone",
+)
+
+
+async def _add_missing_columns(conn) -> None:
+    for statement in _ADDED_COLUMNS:
+        await conn.execute(text(statement))
+
+
+# user_activity: день активности (UTC) и уникальность (user_id, день) для ON CONFLICT.
+# Порядок важен: колонка -> заполнение из activity_date -> удаление дублей -> ограничение.
+_USER_ACTIVITY_DAY_UPGRADE = (
+    "ALTER TABLE user_activity ADD COLUMN IF NOT EXISTS activity_day date",
+    "UPDATE user_activity SET activity_day = (coalesce(activity_date, now()) AT TIME ZONE 'UTC')::date "
+    "WHERE activity_day IS NULL",
+    "DELETE FROM user_activity a USING user_activity b "
+    "WHERE a.user_id = b.user_id AND a.activity_day = b.activity_day AND a.id > b.id",
+    "ALTER TABLE user_activity ALTER COLUMN activity_day SET DEFAULT CURRENT_DATE",
+    "ALTER TABLE user_activity ALTER COLUMN activity_day SET NOT NULL",
+    "ALTER TABLE user_activity ADD CONSTRAINT uq_user_activity_user_day UNIQUE (user_id, activity_day)",
+)
+
+
+async def _upgrade_user_activity(conn) -> None:
+    exists = await conn.scalar(
+        text("SELECT 1 FROM pg_constraint WHERE conname = 'uq_user_activity_user_day'")
+    )
+    if exists:
+        return
+    print("[ensure_schema] user_activity: добавляем activity_day и uq_user_activity_user_day")
+    for statement in _USER_ACTIVITY_DAY_UPGRADE:
+        await conn.execute(text(statement))
+
+
+def _create_missing_indexes(sync_conn) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
 def main() -> None:
     asyncio.run(ensure_schema())
 
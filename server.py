@@ -1,29 +1,36 @@
 
-"""Webhook сервер FastAPI для обработки уведомлений об оплате и запуска бота."""
+"""Webhook сервер FastAPI: уведомления об оплате и (в режиме BOT_MODE=webhook) апдейты Telegram."""
 
 from __future__ import annotations
 
+import hmac
 import logging
-from datetime import datetime, timedelta, timezone
 from json import JSONDecodeError
 from typing import Any
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
-from aiogram import Bot
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from pydantic import ValidationError
 import os
 import aiofiles
 import asyncio
 
-from db.base import get_session  # (13) убрали динамический импорт
-from db.subscribers import (
-    add_subscriber_with_duration,
-    is_payment_processed,
-    mark_payment_processed,
-)
-from db.users import mark_user_has_paid
+from db.base import get_pool_stats, get_session  # (13) убрали динамический импорт
+from db.payments import fulfill_payment
 from db.tariff import get_tariff_by_id
-from config import BOT_TOKEN, SUPPORT_GROUP_ID, SUBSCRIBE_TOPIC_ID
+from bot import check_webhook_config, create_bot, create_dispatcher
+from config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    WEBHOOK_MAX_CONCURRENCY,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+)
+from handlers import register_handlers
+from utils.activity import activity_buffer
+from utils.payment import close_payment_client
 
 
 logger = logging.getLogger(__name__)
@@ -41,16 +48,44 @@ async def custom_404_handler(request: Request, exc):
 
     return HTMLResponse(content=html, status_code=404)
 
-# ------------------------------- Utilities ----------------------------------
-def _calc_expiry(days: int) -> datetime:
-    """Возвращает дату окончания (UTC) (8)."""
-    return datetime.now(timezone.utc) + timedelta(days=days)
+# ------------------------------- Health -------------------------------------
+@app.get("/health")
+async def health() -> JSONResponse:
+    """Состояние процесса и пула соединений БД (для подбора DB_POOL_* под реальную нагрузку)."""
+    return JSONResponse(content={"status": "ok", "db_pool": get_pool_stats()})
+
+# ------------------------------- Telegram -----------------------------------
+@app.post(WEBHOOK_PATH)
+async def telegram_webhook(request: Request) -> JSONResponse:
+    """Приём апдейта Telegram: проверка секрета и обработка с ограничением параллельности."""
+    dp: Dispatcher | None = getattr(app.state, "dp", None)
+    if dp is None:  # режим polling — маршрут не активен
+        raise HTTPException(status_code=404)
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(token, WEBHOOK_SECRET):
+        logger.warning("⚠️ [TG-WEBHOOK] Запрос с неверным секретом отклонён")
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    bot: Bot = app.state.bot
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except (JSONDecodeError, ValidationError) as e:
+        logger.error("❌ [TG-WEBHOOK] Некорректный апдейт: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid update") from e
+
+    # Ответ задерживается до конца обработки: Telegram не шлёт больше max_connections
+    # запросов одновременно, а семафор ограничивает нагрузку на процесс.
+    async with app.state.update_semaphore:
+        try:
+            await dp.feed_update(bot, update)
+        except Exception:  # повтор того же апдейта Telegram'ом ошибку не исправит
+            logger.exception("❌ [TG-WEBHOOK] Ошибка обработки апдейта %s", update.update_id)
+    return JSONResponse(content={"ok": True})
 
 # ------------------------------- Webhook ------------------------------------
 @app.post("/yookassa")
 async def yookassa_webhook(request: Request) -> JSONResponse:  # (2)
     """Обработка webhook YooKassa (без логирования raw JSON) (1,16)."""
-    bot: Bot = app.state.bot
     admin_errors: list[str] = []  # (15) агрегируем ошибки
 
     try:
@@ -77,69 +112,58 @@ async def yookassa_webhook(request: Request) -> JSONResponse:  # (2)
         logger.error("❌ [WEBHOOK] Некорректное числовое поле в webhook: %s", e)
         raise HTTPException(status_code=400, detail="Bad number") from e
 
-    # Idempotency через БД
-    if payment_id:
+    if payment_status != "succeeded":  # сохранили прежнюю проверку статуса
+        return JSONResponse(content={"status": "ok"})
+    if not payment_id:
+        logger.error("❌ [WEBHOOK] Нет id платежа в webhook (user_id=%s)", user_id)
+        raise HTTPException(status_code=400, detail="Missing payment id")
+
+    # Одна транзакция: захват payment_id, продление, флаг оплаты, outbox уведомлений, один commit.
+    # Уведомления отправляет фоновый воркер бота (utils/outbox.py), ответ YooKassa не ждёт Telegram.
+    try:
         async with get_session() as session:
-            if await is_payment_processed(session, payment_id):
-                logger.info("🔁 [WEBHOOK] Дубликат webhook проигнорирован (payment_id=%s, user_id=%s)", payment_id, user_id)
-                return JSONResponse(content={"status": "ok", "duplicate": True})
+            tariff = await get_tariff_by_id(session, tariff_id)
+            if tariff is None:
+                raise LookupError(f"tariff {tariff_id} not found")
+            days = tariff.duration_days
+            expire_at = await fulfill_payment(session, payment_id, user_id, days, tariff_name=tariff.name)
+    except Exception as e:  # (6)
+        logger.exception("❌ [PAYMENT] Ошибка обработки тарифа/подписки (user_id=%s, tariff_id=%s)", user_id, tariff_id)
+        raise HTTPException(status_code=400, detail="Tariff error") from e
+    if expire_at is None:
+        logger.info("🔁 [WEBHOOK] Дубликат webhook проигнорирован (payment_id=%s, user_id=%s)", payment_id, user_id)
+        return JSONResponse(content={"status": "ok", "duplicate": True})
+    logger.info("✅ [PAYMENT] Подписка продлена: user_id=%s, дней=%s, тариф=%s", user_id, days, tariff_id)
 
-    if payment_status == "succeeded":  # сохранили прежнюю проверку статуса
-        days = 0
-        try:
-            async with get_session() as session:
-                # Повторная проверка idempotency (гонка между процессами)
-                if payment_id and await is_payment_processed(session, payment_id):
-                    logger.info("🔁 [WEBHOOK] Дубликат (гонка) webhook проигнорирован (payment_id=%s, user_id=%s)", payment_id, user_id)
-                    return JSONResponse(content={"status": "ok", "duplicate": True})
-                tariff = await get_tariff_by_id(session, tariff_id)
-                days = tariff.duration_days  # type: ignore[assignment]
-                await add_subscriber_with_duration(session, user_id, days)
-                await mark_payment_processed(session, payment_id, user_id)
-                await mark_user_has_paid(session, user_id)
-                logger.info("✅ [PAYMENT] Подписка продлена: user_id=%s, дней=%s, тариф=%s", user_id, days, tariff_id)
-        except Exception as e:  # (6)
-            logger.exception("❌ [PAYMENT] Ошибка обработки тарифа/подписки (user_id=%s, tariff_id=%s)", user_id, tariff_id)
-            raise HTTPException(status_code=400, detail="Tariff error") from e
-
-        # Уведомления пользователя и группы
-        try:
-            user = await bot.get_chat(user_id)
-            username = f"@{user.username}" if getattr(user, "username", None) else "—"
-            full_name = getattr(user, "full_name", None) or getattr(user, "first_name", None) or "—"
-            expire_dt = _calc_expiry(days)
-            expire_str = expire_dt.strftime('%d.%m.%Y')  # локальный формат (8)
-
-            await bot.send_message(
-                user_id,
-                (
-                    f"✅ Ваша подписка продлена на <b>{days} дней</b>!\n\n"
-                    f"🏷️ Тариф: <b>{getattr(tariff, 'name', '—')}</b>\n"
-                    f"📅 Действует до (UTC): <b>{expire_str}</b>"
-                ),
-                parse_mode="HTML",
-            )
-            await bot.send_message(
-                SUPPORT_GROUP_ID,
-                (
-                    f"<b>💳 Новая оплата</b>\n\n"
-                    f"👤 {full_name} ({username})\n"
-                    f"🆔 <code>{user_id}</code>\n"
-                    f"🏷️ {getattr(tariff, 'name', '—')}\n"
-                    f"⏳ {days} дн.\n"
-                    f"📅 До: {expire_str} (UTC)\n"
-                ),
-                parse_mode="HTML",
-                message_thread_id=SUBSCRIBE_TOPIC_ID,
-            )
-        except Exception as e:  # (6)
-            logger.exception("❌ [SEND] Ошибка уведомления пользователя/группы (user_id=%s)", user_id)
-            
     return JSONResponse(content={"status": "ok"})
 
 # ------------------------------- Startup ------------------------------------
 @app.on_event("startup")
 async def on_startup() -> None:  # (2)
-    """Инициализация бота."""
+    """Инициализация бота; в режиме webhook — ещё и диспетчера с хендлерами."""
     logger.info("🚀 [STARTUP] FastAPI запущен (старт сервера)")
-    app.state.bot = Bot(token=BOT_TOKEN)
+    if BOT_MODE != "webhook":
+        app.state.bot = Bot(token=BOT_TOKEN)
+        return
+
+    check_webhook_config()
+    app.state.bot = create_bot()
+    await app.state.bot.me()  # идентичность бота кэшируется один раз на процесс
+    dp = create_dispatcher()
+    register_handlers(dp)
+    await dp.emit_startup(bot=app.state.bot)
+    app.state.update_semaphore = asyncio.Semaphore(WEBHOOK_MAX_CONCURRENCY)
+    app.state.dp = dp
+    activity_buffer.start()
+    logger.info("✅ [STARTUP] Приём апдейтов Telegram: POST %s", WEBHOOK_PATH)
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    """Сброс буфера активности, закрытие хранилища FSM, клиента YooKassa и сессии бота."""
+    dp: Dispatcher | None = getattr(app.state, "dp", None)
+    if dp is not None:
+        await activity_buffer.stop()
+        await dp.emit_shutdown(bot=app.state.bot)
+        await close_payment_client()
+    await app.state.bot.session.close()
@@ -5,3 +5,4 @@ class PromoStates(StatesGroup):
     add = State()      # ожидание ввода промокода и срока
     remove = State()   # ожидание ввода промокода для удаления
     user = State()     # ожидание ввода промокода от пользователя
+    bulk = State()     # ожидание параметров пакетной генерации
@@ -0,0 +1,83 @@
+"""Буфер активности пользователей: дедупликация (user_id, день) в памяти и пакетная запись в БД."""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+from typing import Optional
+
+from db.base import get_session
+from db.metrics import utc_today
+from db.users import insert_user_activities
+from utils.background import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_FLUSH_INTERVAL = 5  # секунд
+ACTIVITY_FLUSH_THRESHOLD = 5000  # досрочный сброс при таком размере буфера
+
+
+class ActivityBuffer(BackgroundTask):
+    """Копит активность в памяти и сбрасывает её одним INSERT раз в `flush_interval` секунд.
+
+    Каждая пара (user_id, день) попадает в БД не более одного раза за жизнь процесса:
+    уже записанные за сегодня пользователи отсекаются ещё до буфера.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = ACTIVITY_FLUSH_INTERVAL,
+        flush_threshold: int = ACTIVITY_FLUSH_THRESHOLD,
+    ):
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._pending: set[tuple[int, datetime.date]] = set()
+        self._flushed_day: Optional[datetime.date] = None
+        self._flushed: set[int] = set()
+        self._flush_now = asyncio.Event()
+
+    def record(self, user_id: int) -> None:
+        """Отмечает активность пользователя (без обращения к БД)."""
+        day = utc_today()
+        if day != self._flushed_day:
+            self._flushed_day = day
+            self._flushed.clear()
+        if user_id in self._flushed:
+            return
+        self._pending.add((user_id, day))
+        if len(self._pending) >= self.flush_threshold:
+            self._flush_now.set()
+
+    async def flush(self) -> None:
+        """Записывает накопленную активность; при ошибке возвращает её в буфер."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, set()
+        try:
+            async with get_session() as session:
+                inserted = await insert_user_activities(session, batch)
+        except Exception:
+            logger.exception("❌ [ACTIVITY] Не удалось записать активность (%s записей)", len(batch))
+            self._pending |= batch
+            return
+        self._flushed.update(user_id for user_id, day in batch if day == self._flushed_day)
+        logger.debug("📝 [ACTIVITY] Записано %s (новых %s) активностей", len(batch), inserted)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def stop(self) -> None:
+        """Останавливает фоновый сброс и записывает остаток."""
+        await super().stop()
+        await self.flush()
+
+
+activity_buffer = ActivityBuffer()
@@ -0,0 +1,37 @@
+"""Базовый класс фоновых воркеров процесса: одна asyncio-задача с запуском и остановкой."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Optional
+
+
+class BackgroundTask:
+    """Крутит корутину `_run` в отдельной задаче.
+
+    `start()` повторно задачу не создаёт; `stop()` отменяет её и дожидается
+    завершения, так что после него воркер больше ничего не делает.
+    Наследники реализуют `_run` (бесконечный цикл) и при необходимости
+    расширяют `start`/`stop`.
+    """
+
+    def __init__(self) -> None:
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        raise NotImplementedError
+
+    def start(self) -> None:
+        """Запускает фоновую задачу."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Отменяет фоновую задачу и ждёт её завершения."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,533 @@
+"""Движок рассылок: token-bucket лимитер, пул отправителей, обработка RetryAfter и задания с чекпоинтом."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from collections import deque
+from contextlib import suppress
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterable, Awaitable, Callable, Iterable, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import (
+    BROADCAST_CHECKPOINT_BATCH,
+    BROADCAST_JOB_LEASE,
+    BROADCAST_JOB_POLL_INTERVAL,
+    BROADCAST_MAX_CONCURRENCY,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_PROGRESS_UPDATE_INTERVAL,
+    BROADCAST_RATE_LIMIT,
+)
+from db.base import get_session
+from db.broadcasts import (
+    JOB_STATUS_FAILED,
+    BroadcastJob,
+    claim_broadcast_jobs,
+    create_broadcast_job,
+    finish_broadcast_job,
+    renew_broadcast_leases,
+    save_broadcast_checkpoint,
+    set_broadcast_progress_message,
+)
+from db.users import (
+    AUDIENCE_ADS,
+    AUDIENCE_ALL,
+    AUDIENCE_NEVER_PAID,
+    count_audience,
+    iter_audience_user_ids,
+    mark_users_unreachable,
+)
+from utils.background import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[["BroadcastStats"], Awaitable[None]]
+UserIds = Union[Iterable[int], AsyncIterable[int]]
+
+
+class TokenBucket:
+    """Token bucket: не более `rate` операций в секунду с допустимым всплеском `capacity`.
+
+    pause() останавливает выдачу токенов всем потребителям (RetryAfter от Telegram
+    относится ко всему боту, а не к конкретному чату).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate должен быть > 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._loop = asyncio.get_running_loop()
+        self._updated_at = self._loop.time()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+    def pause(self, seconds: float) -> None:
+        """Приостанавливает выдачу токенов минимум на `seconds` секунд и обнуляет запас."""
+        now = self._loop.time()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated_at = self._paused_until
+
+    async def acquire(self) -> None:
+        """Ждёт, пока не освободится токен (с учётом паузы)."""
+        async with self._lock:
+            while True:
+                now = self._loop.time()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+_send_limiter: Optional[TokenBucket] = None
+
+
+def get_send_limiter() -> TokenBucket:
+    """Общий для процесса лимитер отправки (рассылки и outbox уведомлений).
+
+    Лимит Telegram (~30 сообщений/сек) и RetryAfter относятся ко всему боту,
+    поэтому все отправители делят один bucket на BROADCAST_RATE_LIMIT.
+    """
+    global _send_limiter
+    if _send_limiter is None:
+        _send_limiter = TokenBucket(BROADCAST_RATE_LIMIT)
+    return _send_limiter
+
+
+@dataclass(slots=True)
+class BroadcastMessage:
+    """Содержимое рассылки: текст, опциональная кнопка-ссылка и медиа (photo/video)."""
+    text: str
+    button_text: Optional[str] = None
+    button_url: Optional[str] = None
+    media_id: Optional[str] = None
+    media_type: Optional[str] = None
+
+    @classmethod
+    def from_state(cls, data: dict) -> "BroadcastMessage":
+        """Собирает сообщение из данных FSM конструктора рассылки."""
+        return cls(
+            text=data.get("text"),
+            button_text=data.get("button_text"),
+            button_url=data.get("button_url"),
+            media_id=data.get("media_id"),
+            media_type=data.get("media_type"),
+        )
+
+    @property
+    def markup(self) -> Optional[InlineKeyboardMarkup]:
+        if self.button_text and self.button_url:
+            return InlineKeyboardMarkup(
+                inline_keyboard=[[InlineKeyboardButton(text=self.button_text, url=self.button_url)]]
+            )
+        return None
+
+    async def send(self, bot: Bot, chat_id: int) -> None:
+        """Отправляет сообщение одному получателю."""
+        markup = self.markup
+        if self.media_id and self.media_type == "photo":
+            await bot.send_photo(chat_id, self.media_id, caption=self.text, reply_markup=markup)
+        elif self.media_id and self.media_type == "video":
+            await bot.send_video(chat_id, self.media_id, caption=self.text, reply_markup=markup)
+        else:
+            await bot.send_message(chat_id, self.text, reply_markup=markup)
+
+
+@dataclass(slots=True)
+class BroadcastStats:
+    """Счётчики рассылки.
+
+    last_user_id — «водяной знак»: все получатели с id <= него уже обработаны
+    (при параллельной отправке завершения приходят не по порядку).
+    unreachable — буфер недоступных получателей (заблокировали бота и т.п.),
+    который владелец рассылки периодически сбрасывает в БД через drain_unreachable().
+    """
+    total: int
+    sent: int = 0
+    failed: int = 0
+    last_user_id: Optional[int] = None
+    unreachable: list[int] = field(default_factory=list)
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed
+
+    def drain_unreachable(self) -> list[int]:
+        """Забирает накопленные недоступные user_id, очищая буфер."""
+        drained, self.unreachable = self.unreachable, []
+        return drained
+
+
+def is_unreachable_error(error: TelegramAPIError) -> bool:
+    """True, если получатель недоступен навсегда: бот заблокирован, аккаунт удалён, чат не найден."""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and "chat not found" in error.message.lower()
+
+
+async def run_broadcast(
+    bot: Bot,
+    user_ids: UserIds,
+    message: BroadcastMessage,
+    *,
+    total: int,
+    stats: Optional[BroadcastStats] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    on_checkpoint: Optional[ProgressCallback] = None,
+    tag: str = "BROADCAST",
+    limiter: Optional[TokenBucket] = None,
+    concurrency: int = BROADCAST_MAX_CONCURRENCY,
+    max_retries: int = BROADCAST_MAX_RETRIES,
+    progress_interval: float = BROADCAST_PROGRESS_UPDATE_INTERVAL,
+    checkpoint_every: int = BROADCAST_CHECKPOINT_BATCH,
+) -> BroadcastStats:
+    """Рассылает `message` по `user_ids` пулом из `concurrency` отправителей.
+
+    user_ids может быть обычным или асинхронным итератором (потоковая выборка из БД),
+    id должны идти по возрастанию: очередь ограничена, поэтому в памяти одновременно
+    находится лишь несколько id.
+
+    Темп ограничен `limiter` — по умолчанию общим для процесса get_send_limiter(),
+    который рассылки делят с outbox уведомлений. TelegramRetryAfter ставит на паузу
+    всех отправителей и повторяет отправку тому же получателю
+    (не более `max_retries` раз). on_progress вызывается раз в `progress_interval`
+    секунд и один раз по завершении; on_checkpoint — после каждых `checkpoint_every`
+    обработанных получателей (для продолжения рассылки с stats.last_user_id).
+    Передав `stats`, можно продолжить счёт прерванной рассылки.
+    """
+    if stats is None:
+        stats = BroadcastStats(total=total)
+    limiter = limiter or get_send_limiter()
+    queue: asyncio.Queue[Optional[int]] = asyncio.Queue(maxsize=concurrency * 2)
+    dispatched: deque[int] = deque()
+    completed: set[int] = set()
+    checkpoint_due = asyncio.Event()
+    checkpointed_at = stats.processed
+
+    def _complete(user_id: int) -> None:
+        nonlocal checkpointed_at
+        completed.add(user_id)
+        while dispatched and dispatched[0] in completed:
+            completed.discard(dispatched[0])
+            stats.last_user_id = dispatched.popleft()
+        if stats.processed - checkpointed_at >= checkpoint_every:
+            checkpointed_at = stats.processed
+            checkpoint_due.set()
+
+    async def _deliver(user_id: int) -> None:
+        for attempt in range(max_retries + 1):
+            await limiter.acquire()
+            try:
+                await message.send(bot, user_id)
+                stats.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                logger.warning(
+                    "⏸️ [%s] Flood control: пауза %s с (user_id=%s, попытка %s)",
+                    tag, e.retry_after, user_id, attempt + 1,
+                )
+                limiter.pause(e.retry_after)
+            except TelegramAPIError as e:
+                logger.info("🚫 [%s] TelegramAPIError: %s", tag, e)
+                if is_unreachable_error(e):
+                    stats.unreachable.append(user_id)
+                stats.failed += 1
+                return
+            except Exception as e:
+                logger.error("🚫 [%s] Неизвестная ошибка при отправке пользователю %s: %s", tag, user_id, e, exc_info=True)
+                stats.failed += 1
+                return
+        stats.failed += 1
+
+    async def _worker() -> None:
+        while True:
+            user_id = await queue.get()
+            try:
+                if user_id is None:
+                    return
+                await _deliver(user_id)
+                _complete(user_id)
+            finally:
+                queue.task_done()
+
+    async def _reporter() -> None:
+        while True:
+            await asyncio.sleep(progress_interval)
+            await on_progress(stats)
+
+    async def _checkpointer() -> None:
+        while True:
+            await checkpoint_due.wait()
+            checkpoint_due.clear()
+            try:
+                await on_checkpoint(stats)
+            except Exception:
+                logger.exception("❌ [%s] Не удалось сохранить чекпоинт рассылки", tag)
+
+    async def _enqueue(user_id: int) -> None:
+        dispatched.append(user_id)
+        await queue.put(user_id)
+
+    workers = [asyncio.create_task(_worker()) for _ in range(concurrency)]
+    background = []
+    if on_progress:
+        background.append(asyncio.create_task(_reporter()))
+    if on_checkpoint:
+        background.append(asyncio.create_task(_checkpointer()))
+    try:
+        if isinstance(user_ids, AsyncIterable):
+            async for user_id in user_ids:
+                await _enqueue(user_id)
+        else:
+            for user_id in user_ids:
+                await _enqueue(user_id)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers + background:
+            task.cancel()
+    if on_progress:
+        await on_progress(stats)
+    return stats
+
+
+def render_progress_bar(sent: int, total: int, bar_length: int = 10) -> str:
+    """Рендерит прогресс-бар рассылки."""
+    percent = min(sent / total, 1) if total else 0
+    filled = int(bar_length * percent)
+    bar = '🟩' * filled + '⬜' * (bar_length - filled)
+    return f"Прогресс: [{bar}] {int(percent*100)}% ({sent}/{total})"
+
+
+def progress_updater(bot: Bot, chat_id: int, message_id: int) -> ProgressCallback:
+    """Возвращает колбэк, обновляющий сообщение с прогресс-баром у администратора."""
+    async def _update(stats: BroadcastStats) -> None:
+        with suppress(TelegramAPIError):
+            await bot.edit_message_text(
+                text=render_progress_bar(stats.processed, stats.total),
+                chat_id=chat_id,
+                message_id=message_id,
+            )
+    return _update
+
+
+# --- Задания рассылки (переживают рестарт бота) ---
+
+@dataclass(frozen=True, slots=True)
+class _AudienceTexts:
+    tag: str
+    title: str
+    total_label: str
+    failed_label: str
+
+
+_AUDIENCE_TEXTS = {
+    AUDIENCE_ALL: _AudienceTexts("BROADCAST", "🔗 [ОБЩАЯ РАССЫЛКА]", "👥 Всего пользователей", "❌ Не доставлено"),
+    AUDIENCE_ADS: _AudienceTexts("AD-BROADCAST", "💸 [РЕКЛАМНАЯ РАССЫЛКА]", "⛔️ Без подписки", "❌ Не доставлено"),
+    AUDIENCE_NEVER_PAID: _AudienceTexts("TRIAL-BROADCAST", "💳 [TRIAL-РАССЫЛКА]", "🧑‍🎓 Новых пользователей", "❗️ Не доставлено"),
+}
+
+async def start_broadcast_job(bot: Bot, admin_id: int, audience: str, message: BroadcastMessage) -> None:
+    """Сохраняет задание рассылки в БД; выполнит его BroadcastJobRunner процесса bot.py.
+
+    Обработчик может работать в реплике server.py (BOT_MODE=webhook), поэтому здесь
+    задание не запускается: его забирает по аренде единственный исполнитель.
+    """
+    async with get_session() as session:
+        total = await count_audience(session, audience)
+        if not total:
+            await bot.send_message(admin_id, "❗️ Аудитория пуста. Сообщение никому не отправлено.")
+            return
+        job = await create_broadcast_job(session, admin_id, audience, asdict(message), total)
+    logger.info("🗂️ [BROADCAST] Рассылка #%s (audience=%s, total=%s) поставлена в очередь", job.id, audience, total)
+    broadcast_runner.wake()
+
+
+class BroadcastJobRunner(BackgroundTask):
+    """Исполнитель заданий рассылки (запускается только в bot.py).
+
+    Раз в `poll_interval` секунд (или сразу после start_broadcast_job в этом же
+    процессе) продлевает аренду своих заданий и забирает из БД задания без живого
+    исполнителя: новые, прерванные остановкой бота и брошенные упавшим процессом
+    (после истечения аренды `lease`). Захват атомарен (claim_broadcast_jobs), а
+    прогресс пишет только владелец, поэтому у задания не бывает двух исполнителей.
+    Задание, аренду которого продлить не удалось, останавливается.
+    """
+
+    def __init__(self, poll_interval: float = BROADCAST_JOB_POLL_INTERVAL, lease: float = BROADCAST_JOB_LEASE):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._bot: Optional[Bot] = None
+        self._jobs: dict[int, asyncio.Task] = {}
+        self._wake = asyncio.Event()
+
+    def wake(self) -> None:
+        """Просит проверить задания сразу, не дожидаясь poll_interval."""
+        self._wake.set()
+
+    async def _notify_resumed(self, job: BroadcastJob) -> None:
+        logger.info(
+            "♻️ [BROADCAST] Возобновление рассылки #%s (audience=%s, last_user_id=%s, sent=%s)",
+            job.id, job.audience, job.last_user_id, job.sent,
+        )
+        with suppress(TelegramAPIError):
+            await self._bot.send_message(job.admin_id, f"♻️ Рассылка #{job.id} возобновлена после перезапуска бота.")
+
+    async def poll(self) -> int:
+        """Продлевает аренду своих заданий, забирает свободные и возвращает число забранных."""
+        async with get_session() as session:
+            renewed = await renew_broadcast_leases(session, self.owner, self.lease)
+        for job_id, task in list(self._jobs.items()):
+            if job_id not in renewed:
+                logger.warning("⚠️ [BROADCAST] Аренда рассылки #%s потеряна, задание остановлено", job_id)
+                task.cancel()
+        async with get_session() as session:
+            jobs = await claim_broadcast_jobs(session, self.owner, self.lease)
+        for job in jobs:
+            if job.progress_message_id is not None:  # уже начиналась: прервана остановкой или падением
+                await self._notify_resumed(job)
+            task = asyncio.create_task(_run_job(self._bot, job, self.owner))
+            self._jobs[job.id] = task
+            task.add_done_callback(lambda _, job_id=job.id: self._jobs.pop(job_id, None))
+        return len(jobs)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("❌ [BROADCAST] Ошибка опроса заданий рассылки")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self, bot: Bot) -> None:
+        """Запускает опрос и выполнение заданий рассылки."""
+        if self._task is None:
+            self._bot = bot
+        super().start()
+
+    async def stop(self) -> None:
+        """Останавливает опрос и свои рассылки: они сохраняют чекпоинт и снимают аренду."""
+        await super().stop()
+        tasks = list(self._jobs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+broadcast_runner = BroadcastJobRunner()
+
+
+async def _flush_unreachable(session: AsyncSession, stats: BroadcastStats) -> None:
+    unreachable = stats.drain_unreachable()
+    if unreachable:
+        marked = await mark_users_unreachable(session, unreachable)
+        logger.info("🧹 [BROADCAST] Помечено недоступными: %s пользователей", marked)
+
+
+async def _save_checkpoint(job_id: int, owner: str, stats: BroadcastStats, *, release: bool = False) -> None:
+    async with get_session() as session:
+        await _flush_unreachable(session, stats)
+        saved = await save_broadcast_checkpoint(
+            session, job_id, owner, stats.last_user_id, stats.sent, stats.failed, release=release
+        )
+    if not saved:
+        logger.warning("⚠️ [BROADCAST] Рассылка #%s уже у другого исполнителя, чекпоинт не записан", job_id)
+
+
+async def _fail_job(
+    bot: Bot, job: BroadcastJob, owner: str, stats: BroadcastStats, texts: _AudienceTexts, error: Exception
+) -> None:
+    """Сохраняет прогресс упавшей рассылки, помечает её failed и сообщает админу."""
+    try:
+        async with get_session() as session:
+            await _flush_unreachable(session, stats)
+            await finish_broadcast_job(
+                session, job.id, owner, stats.last_user_id, stats.sent, stats.failed, status=JOB_STATUS_FAILED
+            )
+    except Exception:
+        logger.exception("❌ [%s] Не удалось сохранить состояние рассылки #%s", texts.tag, job.id)
+    with suppress(TelegramAPIError):
+        await bot.send_message(
+            job.admin_id,
+            (
+                f"{texts.title} #{job.id} остановлена из-за ошибки: {type(error).__name__}\n\n"
+                f"✅ Доставлено: {stats.sent} из {job.total}\n"
+                f"{texts.failed_label}: {stats.failed}"
+            ),
+        )
+
+
+async def _run_job(bot: Bot, job: BroadcastJob, owner: str) -> None:
+    """Выполняет задание рассылки начиная с job.last_user_id и отправляет отчёт админу."""
+    texts = _AUDIENCE_TEXTS[job.audience]
+    message = BroadcastMessage(**job.payload)
+    stats = BroadcastStats(total=job.total, sent=job.sent, failed=job.failed, last_user_id=job.last_user_id)
+    try:
+        progress_message_id = job.progress_message_id
+        if progress_message_id is None:
+            logger.info("📢 [%s] Начинается рассылка #%s для %s пользователей.", texts.tag, job.id, job.total)
+            progress_msg = await bot.send_message(job.admin_id, render_progress_bar(0, job.total))
+            progress_message_id = progress_msg.message_id
+            async with get_session() as session:
+                await set_broadcast_progress_message(session, job.id, owner, progress_message_id)
+
+        stats = await run_broadcast(
+            bot,
+            iter_audience_user_ids(job.audience, after_id=job.last_user_id),
+            message,
+            total=job.total,
+            stats=stats,
+            on_progress=progress_updater(bot, job.admin_id, progress_message_id),
+            on_checkpoint=lambda st: _save_checkpoint(job.id, owner, st),
+            tag=texts.tag,
+        )
+        async with get_session() as session:
+            await _flush_unreachable(session, stats)
+            await finish_broadcast_job(session, job.id, owner, stats.last_user_id, stats.sent, stats.failed)
+    except asyncio.CancelledError:
+        # Остановка бота: сохраняем прогресс и снимаем аренду, следующий запуск продолжит рассылку
+        await asyncio.shield(_save_checkpoint(job.id, owner, stats, release=True))
+        logger.info("⏹️ [%s] Рассылка #%s прервана, чекпоинт last_user_id=%s", texts.tag, job.id, stats.last_user_id)
+        raise
+    except Exception as e:
+        logger.exception("❌ [%s] Рассылка #%s завершилась с ошибкой", texts.tag, job.id)
+        await _fail_job(bot, job, owner, stats, texts, e)
+        return
+
+    sent, failed, total = stats.sent, stats.failed, job.total
+    logger.info("✅ [%s] Рассылка #%s завершена. Отправлено=%s Ошибок=%s", texts.tag, job.id, sent, failed)
+    percent = int(sent / total * 100) if total else 0
+    summary_text = (
+        f"{texts.title} Завершена!\n\n"
+        f"{texts.total_label}: {total}\n"
+        f"✅ Доставлено: {sent} ({percent}%)\n"
+        f"{texts.failed_label}: {failed}"
+    )
+    await bot.send_message(job.admin_id, summary_text, parse_mode="Markdown")
@@ -0,0 +1,114 @@
+"""Планировщик уведомлений об окончании подписки: окна по expire_at с курсором в БД, отправка через outbox."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from db.base import get_session
+from db.outbox import OUTBOX_SUBSCRIPTION_EXPIRED, OUTBOX_SUBSCRIPTION_EXPIRING
+from db.subscription_notices import (
+    enqueue_subscription_notices,
+    get_expiring_batch,
+    get_scheduler_cursor,
+    save_scheduler_cursor,
+)
+from utils.background import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_REMINDER_DAYS = 3  # за сколько дней предупреждать об окончании
+EXPIRY_TICK_INTERVAL = 60  # секунд между проходами
+EXPIRY_BUCKET = timedelta(hours=1)  # максимальный отрезок expire_at за один шаг курсора
+EXPIRY_BATCH_SIZE = 500
+EXPIRY_INITIAL_LOOKBACK = timedelta(days=1)  # окно первого запуска (без курсора в БД)
+
+
+@dataclass(frozen=True, slots=True)
+class _NoticeWindow:
+    """Окно уведомлений: подписки с expire_at <= now + offset, ещё не пройденные курсором."""
+    cursor: str
+    kind: str
+    offset: timedelta
+
+
+_WINDOWS = (
+    _NoticeWindow("expiry_reminder", OUTBOX_SUBSCRIPTION_EXPIRING, timedelta(days=EXPIRY_REMINDER_DAYS)),
+    _NoticeWindow("expiry_sweep", OUTBOX_SUBSCRIPTION_EXPIRED, timedelta(0)),
+)
+
+
+class ExpiryScheduler(BackgroundTask):
+    """Раз в `tick_interval` секунд ставит в outbox уведомления «скоро закончится» и «закончилась».
+
+    Для каждого окна курсор в БД хранит границу уже просмотренных expire_at, и
+    проход читает только отрезок (курсор, now + offset] — кусками по `bucket`,
+    постранично по индексу expire_at, — а не всю таблицу подписчиков. Журнал
+    subscription_notices не даёт отправить одно уведомление дважды (например,
+    после падения между страницей и сохранением курсора). Отправляет воркер
+    outbox через общий с рассылками лимитер (utils.broadcast.get_send_limiter).
+    """
+
+    def __init__(
+        self,
+        tick_interval: float = EXPIRY_TICK_INTERVAL,
+        bucket: timedelta = EXPIRY_BUCKET,
+        batch_size: int = EXPIRY_BATCH_SIZE,
+    ):
+        super().__init__()
+        self.tick_interval = tick_interval
+        self.bucket = bucket
+        self.batch_size = batch_size
+
+    async def _process_bucket(self, kind: str, start: datetime, end: datetime) -> int:
+        queued = 0
+        after: Optional[tuple[datetime, int]] = None
+        while True:
+            async with get_session() as session:
+                rows = await get_expiring_batch(session, start, end, after=after, limit=self.batch_size)
+                queued += await enqueue_subscription_notices(session, kind, rows)
+            if len(rows) < self.batch_size:
+                return queued
+            after = (rows[-1].expire_at, rows[-1].user_id)
+
+    async def _advance(self, window: _NoticeWindow) -> int:
+        """Доводит курсор окна до now + offset и возвращает число поставленных уведомлений."""
+        now = datetime.now(timezone.utc)
+        target = now + window.offset
+        async with get_session() as session:
+            cursor = await get_scheduler_cursor(session, window.cursor)
+        if cursor is None:
+            cursor = target - EXPIRY_INITIAL_LOOKBACK
+        if window.offset > timedelta(0):
+            # После простоя или при первом запуске окно напоминаний не уходит в прошлое:
+            # об уже истёкших подписках сообщает только окно «закончилась»
+            cursor = max(cursor, now)
+        queued = 0
+        while cursor < target:
+            bucket_end = min(cursor + self.bucket, target)
+            queued += await self._process_bucket(window.kind, cursor, bucket_end)
+            async with get_session() as session:
+                await save_scheduler_cursor(session, window.cursor, bucket_end)
+            cursor = bucket_end
+        return queued
+
+    async def tick(self) -> None:
+        """Один проход по всем окнам."""
+        for window in _WINDOWS:
+            queued = await self._advance(window)
+            if queued:
+                logger.info("⏰ [EXPIRY] %s: поставлено уведомлений: %s", window.kind, queued)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("❌ [EXPIRY] Ошибка прохода по окончаниям подписок")
+            await asyncio.sleep(self.tick_interval)
+
+
+expiry_scheduler = ExpiryScheduler()
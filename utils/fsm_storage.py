@@ -0,0 +1,120 @@
+"""Хранилища FSM: Postgres (таблица fsm_state) с write-through кэшем, Redis или память."""
+
+from __future__ import annotations
+
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_CACHE_SIZE, FSM_CACHE_TTL, FSM_REDIS_URL, FSM_STORAGE
+from db.base import get_session
+from db.fsm import get_fsm_record, save_fsm_data, save_fsm_state
+
+logger = logging.getLogger(__name__)
+
+
+class SQLStorage(BaseStorage):
+    """Хранилище FSM в Postgres.
+
+    Запись идёт сразу в БД и в локальный кэш (write-through), чтение — из кэша,
+    пока запись в нём не старше `cache_ttl` секунд. При нескольких процессах бота
+    другой процесс может видеть устаревшее состояние не дольше `cache_ttl`:
+    без sticky-маршрутизации апдейтов ставьте FSM_CACHE_TTL=0.
+    """
+
+    def __init__(
+        self,
+        cache_ttl: float = FSM_CACHE_TTL,
+        cache_size: int = FSM_CACHE_SIZE,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self._cache: OrderedDict[str, tuple[float, Optional[str], Dict[str, Any]]] = OrderedDict()
+
+    def _cached(self, key: str) -> Optional[tuple[Optional[str], Dict[str, Any]]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.cache_ttl:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1], entry[2]
+
+    def _remember(self, key: str, state: Optional[str], data: Dict[str, Any]) -> None:
+        if self.cache_ttl <= 0:
+            return
+        self._cache[key] = (time.monotonic(), state, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, key: str) -> tuple[Optional[str], Dict[str, Any]]:
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        async with get_session() as session:
+            state, data = await get_fsm_record(session, key)
+        self._remember(key, state, data)
+        return state, data
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        value = state.state if isinstance(state, State) else state
+        async with get_session() as session:
+            await save_fsm_state(session, storage_key, value)
+        cached = self._cached(storage_key)
+        if cached is not None:
+            self._remember(storage_key, value, cached[1])
+        else:
+            self._cache.pop(storage_key, None)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f"Data must be a dict, got {type(data).__name__}")
+        storage_key = self.key_builder.build(key)
+        value = copy.deepcopy(data)
+        async with get_session() as session:
+            await save_fsm_data(session, storage_key, value)
+        cached = self._cached(storage_key)
+        if cached is not None:
+            self._remember(storage_key, cached[0], value)
+        else:
+            self._cache.pop(storage_key, None)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        self._cache.clear()
+
+
+def create_fsm_storage() -> BaseStorage:
+    """Создаёт хранилище FSM по FSM_STORAGE (sql | redis | memory)."""
+    if FSM_STORAGE == "sql":
+        storage: BaseStorage = SQLStorage()
+    elif FSM_STORAGE == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:  # пакет redis не установлен
+            raise RuntimeError("FSM_STORAGE=redis требует пакет redis (pip install redis)") from e
+        storage = RedisStorage.from_url(FSM_REDIS_URL)
+    elif FSM_STORAGE == "memory":
+        storage = MemoryStorage()
+    else:
+        raise RuntimeError("FSM_STORAGE must be 'sql', 'redis' or 'memory'")
+    logger.info("✅ [FSM] Хранилище состояний: %s", FSM_STORAGE)
+    return storage
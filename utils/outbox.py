@@ -0,0 +1,203 @@
+"""Воркер outbox уведомлений: забирает записи пачками, отправляет с общим лимитом и повторяет с backoff."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import suppress
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import SUBSCRIBE_TOPIC_ID, SUPPORT_GROUP_ID
+from db.base import get_session
+from db.outbox import (
+    OUTBOX_PAYMENT_ADMIN,
+    OUTBOX_PAYMENT_USER,
+    OUTBOX_SUBSCRIPTION_EXPIRED,
+    OUTBOX_SUBSCRIPTION_EXPIRING,
+    claim_outbox_batch,
+    delete_outbox_messages,
+    reschedule_outbox_message,
+)
+from db.subscribers import forget_paid_status
+from utils.background import BackgroundTask
+from utils.broadcast import TokenBucket, get_send_limiter, is_unreachable_error
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_POLL_INTERVAL = 2  # секунд между опросами пустой очереди
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_LEASE = 120  # секунд: запись, взятая упавшим воркером, вернётся в очередь
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_BASE = 5  # секунд, удваивается с каждой попыткой
+OUTBOX_RETRY_MAX = 900
+
+# (chat_id, текст, message_thread_id, клавиатура)
+Rendered = tuple[int, str, Optional[int], Optional[InlineKeyboardMarkup]]
+Renderer = Callable[[Bot, dict[str, Any]], Awaitable[Rendered]]
+
+
+def _expire_str(payload: dict[str, Any]) -> str:
+    return datetime.fromisoformat(payload["expire_at"]).strftime('%d.%m.%Y')
+
+
+async def _render_payment_user(bot: Bot, payload: dict[str, Any]) -> Rendered:
+    forget_paid_status(payload["user_id"])  # оплата прошла в server.py: сбросить кэш guard в этом процессе
+    text = (
+        f"✅ Ваша подписка продлена на <b>{payload['days']} дней</b>!\n\n"
+        f"🏷️ Тариф: <b>{payload.get('tariff_name') or '—'}</b>\n"
+        f"📅 Действует до (UTC): <b>{_expire_str(payload)}</b>"
+    )
+    return payload["user_id"], text, None, None
+
+
+async def _render_payment_admin(bot: Bot, payload: dict[str, Any]) -> Rendered:
+    user_id = payload["user_id"]
+    username, full_name = "—", "—"
+    with suppress(TelegramAPIError):  # имя — украшение, без него уведомление всё равно уходит
+        user = await bot.get_chat(user_id)
+        username = f"@{user.username}" if getattr(user, "username", None) else "—"
+        full_name = getattr(user, "full_name", None) or getattr(user, "first_name", None) or "—"
+    text = (
+        f"<b>💳 Новая оплата</b>\n\n"
+        f"👤 {full_name} ({username})\n"
+        f"🆔 <code>{user_id}</code>\n"
+        f"🏷️ {payload.get('tariff_name') or '—'}\n"
+        f"⏳ {payload['days']} дн.\n"
+        f"📅 До: {_expire_str(payload)} (UTC)\n"
+    )
+    return SUPPORT_GROUP_ID, text, SUBSCRIBE_TOPIC_ID, None
+
+
+def _renew_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="💳 Продлить подписку", callback_data="subscribe")]]
+    )
+
+
+async def _render_subscription_expiring(bot: Bot, payload: dict[str, Any]) -> Rendered:
+    text = (
+        f"⏳ Ваша подписка заканчивается <b>{_expire_str(payload)}</b> (UTC).\n\n"
+        "Продлите её заранее, чтобы не потерять доступ."
+    )
+    return payload["user_id"], text, None, _renew_keyboard()
+
+
+async def _render_subscription_expired(bot: Bot, payload: dict[str, Any]) -> Rendered:
+    text = (
+        "❌ Ваша подписка закончилась.\n\n"
+        "Оформите новую, чтобы снова пользоваться всеми возможностями."
+    )
+    return payload["user_id"], text, None, _renew_keyboard()
+
+
+_RENDERERS: dict[str, Renderer] = {
+    OUTBOX_PAYMENT_USER: _render_payment_user,
+    OUTBOX_PAYMENT_ADMIN: _render_payment_admin,
+    OUTBOX_SUBSCRIPTION_EXPIRING: _render_subscription_expiring,
+    OUTBOX_SUBSCRIPTION_EXPIRED: _render_subscription_expired,
+}
+
+
+def _retry_delay(attempts: int) -> float:
+    """Экспоненциальная задержка перед повтором (попытки считаются с 1)."""
+    return min(OUTBOX_RETRY_BASE * 2 ** (attempts - 1), OUTBOX_RETRY_MAX)
+
+
+class OutboxWorker(BackgroundTask):
+    """Доставляет уведомления из notification_outbox.
+
+    Пока очередь не пуста, пачки забираются подряд; пустая очередь опрашивается
+    раз в `poll_interval` секунд. Ошибка отправки откладывает запись с
+    экспоненциальным backoff, недоступный получатель или исчерпанные попытки
+    прекращают доставку (запись остаётся в таблице с next_attempt_at = NULL).
+    Темп общий с рассылками (get_send_limiter): вместе они не превышают
+    BROADCAST_RATE_LIMIT, а RetryAfter у любого отправителя тормозит всех.
+    """
+
+    def __init__(
+        self,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+    ):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._bot: Optional[Bot] = None
+        self._limiter: Optional[TokenBucket] = None
+
+    async def _deliver(self, kind: str, payload: dict[str, Any]) -> None:
+        renderer = _RENDERERS.get(kind)
+        if renderer is None:
+            raise LookupError(f"неизвестный вид уведомления: {kind}")
+        chat_id, text, thread_id, markup = await renderer(self._bot, payload)
+        await self._limiter.acquire()
+        await self._bot.send_message(
+            chat_id, text, parse_mode="HTML", message_thread_id=thread_id, reply_markup=markup
+        )
+
+    async def _process(self, row) -> bool:
+        """Отправляет одно уведомление; True — доставлено."""
+        try:
+            await self._deliver(row.kind, row.payload)
+            return True
+        except TelegramRetryAfter as e:
+            self._limiter.pause(e.retry_after)
+            error: Exception = e
+            delay: Optional[float] = e.retry_after
+        except TelegramAPIError as e:
+            error = e
+            delay = None if is_unreachable_error(e) else _retry_delay(row.attempts)
+        except LookupError as e:
+            error, delay = e, None
+        except Exception as e:
+            logger.exception("❌ [OUTBOX] Ошибка отправки уведомления #%s (%s)", row.id, row.kind)
+            error, delay = e, _retry_delay(row.attempts)
+        if delay is not None and row.attempts >= OUTBOX_MAX_ATTEMPTS:
+            delay = None
+        async with get_session() as session:
+            await reschedule_outbox_message(session, row.id, delay, repr(error))
+        if delay is None:
+            logger.error(
+                "🚫 [OUTBOX] Уведомление #%s (%s) не доставлено (попыток: %s): %s",
+                row.id, row.kind, row.attempts, error,
+            )
+        else:
+            logger.warning("🔁 [OUTBOX] Уведомление #%s (%s): повтор через %s с (%s)", row.id, row.kind, delay, error)
+        return False
+
+    async def drain(self) -> int:
+        """Обрабатывает одну пачку и возвращает её размер."""
+        async with get_session() as session:
+            rows = await claim_outbox_batch(session, self.batch_size, OUTBOX_LEASE)
+        if not rows:
+            return 0
+        delivered = [row.id for row in rows if await self._process(row)]
+        async with get_session() as session:
+            await delete_outbox_messages(session, delivered)
+        logger.debug("📬 [OUTBOX] Доставлено %s из %s уведомлений", len(delivered), len(rows))
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                claimed = await self.drain()
+            except Exception:
+                logger.exception("❌ [OUTBOX] Ошибка обработки очереди уведомлений")
+                claimed = 0
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self, bot: Bot) -> None:
+        """Запускает фоновую доставку уведомлений (недоставленное с прошлого запуска ждёт в БД)."""
+        if self._task is None:
+            self._bot = bot
+            self._limiter = get_send_limiter()
+        super().start()
+
+
+outbox_worker = OutboxWorker()
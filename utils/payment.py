@@ -2,11 +2,14 @@
 
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import uuid
-from typing import NamedTuple, Optional, Dict
+from contextlib import suppress
+from typing import Any, NamedTuple, Optional, Dict
 
-from yookassa import Configuration, Payment
+import aiohttp
 from yookassa.domain.notification import WebhookNotification
 
 from config import SHOP_ID, API_KEY
@@ -18,6 +21,19 @@ CURRENCY = "RUB"
 EMAIL_DOMAIN_FALLBACK = "example.local"  # Заглушка для чеков (при необходимости заменить)
 MAX_DESCRIPTION_LEN = 128  # Практическое ограничение (YooKassa допускает больше, но держим короче)
 
+API_URL = "https://api.yookassa.ru/v3"
+API_TIMEOUT = 10  # сек на одну попытку (SDK ждёт ответа без ограничения)
+API_MAX_ATTEMPTS = 3
+API_RETRY_BACKOFF = 0.5  # сек, удваивается с каждой попыткой
+API_MAX_CONNECTIONS = 20  # одновременных запросов к YooKassa на процесс
+RETRYABLE_STATUSES = {202, 429, 500, 502, 503, 504}
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+class PaymentError(Exception):
+    """Платёж не создан: ошибка API YooKassa или исчерпаны повторы."""
+
 
 class PaymentResult(NamedTuple):
     """Результат создания платежа: URL для оплаты и ID платежа."""
@@ -25,35 +41,20 @@ class PaymentResult(NamedTuple):
     payment_id: str
 
 
-def _ensure_configuration() -> None:
-    """Гарантирует инициализацию SDK (контракт: SHOP_ID/API_KEY должны быть заданы)."""
-    if not SHOP_ID or not API_KEY:
-        raise RuntimeError("YooKassa credentials (SHOP_ID/API_KEY) не заданы")
-    Configuration.account_id = SHOP_ID
-    Configuration.secret_key = API_KEY
-
-
 def _gen_idempotence_key() -> str:
     """Генерирует уникальный idempotence key (UUID4)."""
     return str(uuid.uuid4())
 
 
-def create_payment(
+def _build_payload(
     user_id: int,
     amount: int,
     description: str,
     bot_username: str,
-    metadata: Optional[Dict[str, str]] = None,
-    capture: bool = True,
-) -> PaymentResult:
-    """Создаёт платёж YooKassa.
-
-    Contract:
-      inputs: user_id>0, amount>0 (в рублях), непустой description (усекается до 128), bot_username без '@'
-      returns: PaymentResult(url, payment_id)
-      raises: ValueError (невалидные аргументы), RuntimeError (нет конфигурации), исключения SDK/сети (пробрасываются)
-      guarantees: currency=RUB, сумма с 2 знаками, идемпотентность на уровне вызова (уникальный ключ)
-    """
+    metadata: Optional[Dict[str, str]],
+    capture: bool,
+) -> Dict[str, Any]:
+    """Валидирует аргументы и собирает тело запроса создания платежа."""
     if user_id <= 0:
         raise ValueError("user_id должен быть > 0")
     if amount <= 0:
@@ -74,9 +75,6 @@ def create_payment(
     meta: Dict[str, str] = dict(metadata) if metadata else {}
     meta.setdefault("user_id", str(user_id))
 
-    _ensure_configuration()
-    idempotence_key = _gen_idempotence_key()
-
     receipt_data = {
         "customer": {
             # Минимально допустимый email-заглушка для чека.
@@ -94,7 +92,7 @@ def create_payment(
         ],
     }
 
-    payload = {
+    return {
         "amount": {"value": value_str, "currency": CURRENCY},
         "confirmation": {
             "type": "redirect",
@@ -106,13 +104,85 @@ def create_payment(
         "receipt": receipt_data,
     }
 
-    payment = Payment.create(payload, idempotence_key)
+
+def _get_http_session() -> aiohttp.ClientSession:
+    """Общая HTTP-сессия к API YooKassa (пул соединений ограничен API_MAX_CONNECTIONS)."""
+    global _http_session  # noqa: PLW0603
+    if _http_session is None or _http_session.closed:
+        if not SHOP_ID or not API_KEY:
+            raise RuntimeError("YooKassa credentials (SHOP_ID/API_KEY) не заданы")
+        _http_session = aiohttp.ClientSession(
+            auth=aiohttp.BasicAuth(str(SHOP_ID), API_KEY),
+            timeout=aiohttp.ClientTimeout(total=API_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=API_MAX_CONNECTIONS),
+        )
+    return _http_session
+
+
+async def close_payment_client() -> None:
+    """Закрывает HTTP-сессию YooKassa (при остановке процесса)."""
+    global _http_session  # noqa: PLW0603
+    if _http_session is not None:
+        await _http_session.close()
+        _http_session = None
+
+
+async def _post_payment(payload: Dict[str, Any], idempotence_key: str) -> Dict[str, Any]:
+    """POST /payments с повторами при сетевых ошибках, 202, 429 и 5xx.
+
+    Повторы безопасны: все попытки идут с одним Idempotence-Key, YooKassa вернёт тот же платёж.
+    """
+    session = _get_http_session()
+    headers = {"Idempotence-Key": idempotence_key}
+    for attempt in range(1, API_MAX_ATTEMPTS + 1):
+        delay = API_RETRY_BACKOFF * 2 ** (attempt - 1)
+        try:
+            async with session.post(f"{API_URL}/payments", json=payload, headers=headers) as response:
+                if response.status == 200:
+                    return await response.json()
+                body = await response.text()
+                if response.status not in RETRYABLE_STATUSES:
+                    raise PaymentError(f"YooKassa вернула {response.status}: {body[:300]}")
+                if response.status == 202:  # платёж ещё создаётся — ждём, сколько просит API
+                    with suppress(ValueError, TypeError):
+                        delay = max(delay, int(json.loads(body).get("retry_after", 0)) / 1000)
+                error: Exception = PaymentError(f"YooKassa вернула {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = e
+        if attempt < API_MAX_ATTEMPTS:
+            logger.warning(
+                "⚠️ [PAYMENT] Попытка %s/%s создания платежа не удалась (%s), повтор через %.1f с",
+                attempt, API_MAX_ATTEMPTS, error, delay,
+            )
+            await asyncio.sleep(delay)
+    raise PaymentError(f"Не удалось создать платёж за {API_MAX_ATTEMPTS} попыток") from error
+
+
+async def create_payment(
+    user_id: int,
+    amount: int,
+    description: str,
+    bot_username: str,
+    metadata: Optional[Dict[str, str]] = None,
+    capture: bool = True,
+) -> PaymentResult:
+    """Создаёт платёж YooKassa (асинхронно, не блокирует event loop).
+
+    Contract:
+      inputs: user_id>0, amount>0 (в рублях), непустой description (усекается до 128), bot_username без '@'
+      returns: PaymentResult(url, payment_id)
+      raises: ValueError (невалидные аргументы), RuntimeError (нет конфигурации),
+              PaymentError (ответ API / исчерпаны повторы с таймаутом API_TIMEOUT на попытку)
+      guarantees: currency=RUB, сумма с 2 знаками, идемпотентность на уровне вызова (уникальный ключ)
+    """
+    payload = _build_payload(user_id, amount, description, bot_username, metadata, capture)
+    payment = await _post_payment(payload, _gen_idempotence_key())
 
     logger.info(
         "💸 [PAYMENT] Платеж создан: id=%s user=%s amount=%s capture=%s",
-        payment.id, user_id, value_str, capture
+        payment["id"], user_id, payload["amount"]["value"], capture
     )
-    return PaymentResult(payment.confirmation.confirmation_url, payment.id)
+    return PaymentResult(payment["confirmation"]["confirmation_url"], payment["id"])
 
 
 def parse_webhook_notification(request_body: dict) -> WebhookNotification | None:
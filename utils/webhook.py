@@ -13,7 +13,7 @@ from aiogram.fsm.storage.base import StorageKey
 
 from utils import payment
 from db.base import get_session
-from db.subscribers import add_subscriber_with_duration, get_subscriber_expiry
+from db.subscribers import add_subscriber_with_duration
 from db.tariff import get_tariff_by_id, Tariff  # предполагается, что Tariff доступен
 
 logger = logging.getLogger(__name__)
@@ -25,8 +25,7 @@ async def _handle_user_payment(user_id: int, tariff: Tariff) -> Optional[datetim
     """Продлевает подписку пользователя и возвращает дату окончания (UTC) или None при сбое."""
     days = tariff.duration_days
     async with get_session() as session:
-        await add_subscriber_with_duration(session, user_id, days)
-        return await get_subscriber_expiry(session, user_id)
+        return await add_subscriber_with_duration(session, user_id, days)
 
 
 async def _notify_user_and_show_keys(user_id: int, bot: Bot, request: web.Request, expiry: Optional[datetime]):